@@ -0,0 +1,69 @@
+"""Parity check and timing for the lxml product extraction engine.
+
+Every ``fixtures/product/*.html`` page is extracted with ProductExtractor and
+compared against the ``*.expected.json`` record next to it (produced by the
+original BeautifulSoup extractors). Run from the repository root:
+
+    python benchmarks/bench_extraction.py --repeat 200
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from extraction import ProductExtractor, parse_html  # noqa: E402
+
+FIXTURES = Path(__file__).resolve().parent / 'fixtures' / 'product'
+
+
+def check_parity(html: str, expected_path: Path) -> bool:
+    got = json.loads(json.dumps(ProductExtractor(html).extract(), ensure_ascii=False))
+    expected = json.loads(expected_path.read_text(encoding='utf-8'))
+    if got == expected and list(got) == list(expected):
+        return True
+    for key in expected.keys() | got.keys():
+        if got.get(key) != expected.get(key):
+            print(f"  {key}: got {got.get(key)!r}, expected {expected.get(key)!r}")
+    return False
+
+
+def time_per_page(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+
+    try:
+        from bs4 import BeautifulSoup
+    except ImportError:
+        BeautifulSoup = None
+
+    failures = 0
+    for page in sorted(FIXTURES.glob('*.html')):
+        html = page.read_text(encoding='utf-8')
+        ok = check_parity(html, page.with_suffix('.expected.json'))
+        failures += not ok
+
+        parse_s = time_per_page(lambda: parse_html(html), args.repeat)
+        total_s = time_per_page(lambda: ProductExtractor(html).extract(), args.repeat)
+        line = (f"{page.name:40} parity={'ok' if ok else 'FAIL'} "
+                f"parse={parse_s * 1e3:.3f}ms parse+extract={total_s * 1e3:.3f}ms")
+        if BeautifulSoup is not None:
+            bs4_s = time_per_page(lambda: BeautifulSoup(html, 'lxml'), args.repeat)
+            line += f" (bs4 parse alone={bs4_s * 1e3:.3f}ms)"
+        print(line)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+"""End-to-end benchmark of the scrapers against the local stand-in server (no network).
+
+Times the same code paths a real run takes, with every page served from
+``fixtures/`` by ``stand_in.py``:
+
+- static: whole products through ``ScrapeSession.scrape``, product fields
+  checked against the ``*.expected.json`` fixtures
+- reviews: ``ScrapeSession.scrape`` of the products with review pages
+  (ReviewCrawler over HTTP), review counts checked
+- qa: DynamicScraper's Q&A stage, only with ``--browser`` (needs Playwright's Firefox)
+- output: JSONL sink and, when pyarrow is installed, the Parquet exporter
+
+Without ``--browser`` the session gets ``stand_in.StubBrowserPool``, so the
+Q&A stage of every scrape fails straight away.
+
+For each it reports throughput and the tracemalloc peak of a second pass, then
+the mean latency of every extractor step. ``--save`` writes the numbers as
+JSON; ``--baseline`` compares against such a file and exits non-zero when a
+throughput drops, or a memory peak grows, by more than ``--tolerance``.
+Run from the repository root:
+
+    python benchmarks/bench_pipeline.py --copies 50 --save bench.json
+    python benchmarks/bench_pipeline.py --baseline bench.json --tolerance 0.3
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import re
+import resource
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+import stand_in  # noqa: E402
+
+# Record fields filled in by the dynamic stages rather than the product page
+DYNAMIC_FIELDS = ('Reviews', 'QA', 'fully_scraped')
+
+# Per section, the numbers a regression is checked on and whether higher is better
+CHECKED = {
+    'static': {'products_per_min': True, 'peak_mb': False},
+    'reviews': {'reviews_per_s': True, 'peak_mb': False},
+    'qa': {'questions_per_s': True, 'peak_mb': False},
+    'output': {'records_per_s': True, 'peak_mb': False},
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def configure(base_url: str, output_dir: str, workers: int = 0):
+    """Point the scrapers at the stand-in; must run before anything in src/ is imported."""
+    os.environ.update({
+        'SCRAPER_AMAZON_BASE_URL': base_url,
+        'SCRAPER_OUTPUT_DIR': output_dir,
+        'SCRAPER_SEEN_IDS_DB': os.path.join(output_dir, 'seen_ids.sqlite3'),
+        'SCRAPER_EXTRACT_WORKERS': str(workers),
+        # pacing, caching and metrics files are not what is being measured
+        'SCRAPER_HOST_RATE': '1000000',
+        'SCRAPER_HOST_BURST': '1000000',
+        'SCRAPER_SNAPSHOT_CACHE': '0',
+        'SCRAPER_METRICS_DUMP': '',
+        'SCRAPER_FIRST_PARTY_DOMAINS': '127.0.0.1',
+    })
+
+
+def expected_records() -> dict:
+    return {asin: json.loads(page.with_suffix('.expected.json').read_text(encoding='utf-8'))
+            for asin, page in stand_in.product_pages().items()}
+
+
+def expected_review_counts() -> dict:
+    counts = {}
+    for page in (stand_in.FIXTURES / 'reviews').glob('*_page*.html'):
+        asin = page.name.split('_page')[0]
+        counts.setdefault(asin, set()).update(re.findall(r'id="(R[A-Z0-9]+)"', page.read_text(encoding='utf-8')))
+    return {asin: len(ids) for asin, ids in counts.items()}
+
+
+def expected_question_counts() -> dict:
+    return {page.stem: page.read_text(encoding='utf-8').count('id="question-')
+            for page in (stand_in.FIXTURES / 'qa').glob('*.html')}
+
+
+def product_fields(record: dict) -> dict:
+    return {key: value for key, value in record.items() if key not in DYNAMIC_FIELDS}
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+async def gather_limited(coroutines: list, concurrency: int) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(limited(coroutine) for coroutine in coroutines))
+
+
+async def timed(coroutine):
+    start = time.perf_counter()
+    result = await coroutine
+    return result, time.perf_counter() - start
+
+
+async def scrape_all(ctx, urls: list) -> list:
+    """``(record, seconds)`` of each URL through the session, without the per-product printouts."""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return await gather_limited([timed(ctx['session'].scrape(url)) for url in urls], ctx['concurrency'])
+
+
+async def bench_static(ctx, copies: int) -> dict:
+    expected = expected_records()
+
+    urls = [(asin, f"{ctx['base_url']}/dp/{asin}?copy={i}") for i in range(copies) for asin in expected]
+    start = time.perf_counter()
+    results = await scrape_all(ctx, [url for _, url in urls])
+    seconds = time.perf_counter() - start
+
+    mismatches = sum(json.loads(json.dumps(product_fields(record), ensure_ascii=False)) !=
+                     product_fields(expected[asin])
+                     for (asin, _), (record, _) in zip(urls, results))
+    latencies = [latency for _, latency in results]
+    ctx['records'] = [record for record, _ in results]
+    return {
+        'products': len(urls),
+        'seconds': seconds,
+        'products_per_min': len(urls) / seconds * 60,
+        'p50_ms': percentile(latencies, 0.50) * 1e3,
+        'p95_ms': percentile(latencies, 0.95) * 1e3,
+        'mismatches': mismatches,
+    }
+
+
+async def bench_reviews(ctx, copies: int) -> dict:
+    expected = expected_review_counts()
+
+    asins = [asin for _ in range(copies) for asin in expected]
+    start = time.perf_counter()
+    results = await scrape_all(ctx, [f"{ctx['base_url']}/dp/{asin}?copy={i}" for i, asin in enumerate(asins)])
+    seconds = time.perf_counter() - start
+
+    results = [record.get('Reviews') or [] for record, _ in results]
+    reviews = sum(len(result) for result in results)
+    return {
+        'products': len(asins),
+        'reviews': reviews,
+        'seconds': seconds,
+        'reviews_per_s': reviews / seconds,
+        'mismatches': sum(len(result) != expected[asin] for asin, result in zip(asins, results)),
+    }
+
+
+async def bench_qa(ctx, copies: int) -> dict:
+    from dynamic import DynamicScraper
+
+    expected = expected_question_counts()
+
+    async def qa(asin):
+        scraper = DynamicScraper(f"{ctx['base_url']}/dp/{asin}", product_data={'ASIN': asin},
+                                 browser_pool=ctx['session'].browser_pool, use_proxy=False)
+        return await scraper.get_product_qa()
+
+    asins = [asin for _ in range(copies) for asin in expected]
+    start = time.perf_counter()
+    results = await gather_limited([qa(asin) for asin in asins], ctx['concurrency'])
+    seconds = time.perf_counter() - start
+
+    questions = sum(len(result) for result in results)
+    return {
+        'products': len(asins),
+        'questions': questions,
+        'answers': sum(len(item.all_answers or ()) for result in results for item in result),
+        'seconds': seconds,
+        'questions_per_s': questions / seconds,
+        'mismatches': sum(len(result) != expected[asin] for asin, result in zip(asins, results)),
+    }
+
+
+def bench_output(ctx, copies: int) -> dict:
+    from output_sink import JsonlSink
+
+    records = ctx['records'] * copies
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        with JsonlSink(directory=directory, prefix='bench') as sink:
+            for record in records:
+                sink.write(record)
+        seconds = time.perf_counter() - start
+        written = sum(path.stat().st_size for path in Path(directory).iterdir())
+
+        result = {
+            'records': len(records),
+            'seconds': seconds,
+            'records_per_s': len(records) / seconds,
+            'mb_per_s': written / seconds / 1e6,
+        }
+        try:
+            from parquet_export import ParquetExporter
+            start = time.perf_counter()
+            with ParquetExporter(Path(directory) / 'parquet') as exporter:
+                for record in records:
+                    exporter.add(record)
+            result['parquet_records_per_s'] = len(records) / (time.perf_counter() - start)
+        except ImportError:
+            pass
+    return result
+
+
+async def run_section(name: str, ctx, copies: int):
+    if name == 'output':
+        return bench_output(ctx, copies)
+    return await {'static': bench_static, 'reviews': bench_reviews, 'qa': bench_qa}[name](ctx, copies)
+
+
+async def run(args) -> dict:
+    from metrics import get_metrics
+    from scraper import ScrapeSession
+
+    sections = ['static', 'reviews'] + (['qa'] if args.browser else []) + ['output']
+    runner = await stand_in.start(port=args.port, latency=args.latency_ms / 1000)
+    ctx = {
+        'base_url': args.base_url,
+        'concurrency': args.concurrency,
+        'session': ScrapeSession(browser_pool=None if args.browser else stand_in.StubBrowserPool()),
+    }
+    results = {}
+    try:
+        await ctx['session'].__aenter__()
+        # warm-up: connection pool, selector spec, worker processes
+        await bench_static(ctx, 1)
+
+        for name in sections:
+            results[name] = await run_section(name, ctx, args.copies)
+        extract = {series: stats for series, stats in get_metrics().snapshot()['histograms'].items()
+                   if 'stage="extract' in series}
+
+        # second pass of each section for its allocation peak; tracemalloc slows everything down
+        for name in sections:
+            tracemalloc.start()
+            await run_section(name, ctx, args.copies)
+            results[name]['peak_mb'] = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.stop()
+    finally:
+        await ctx['session'].close()
+        await runner.cleanup()
+
+    if not args.browser:
+        results['qa'] = {'skipped': 'needs --browser'}
+    results['extractors'] = {
+        re.sub(r'^scraper_stage_seconds', '', series): {'count': stats['count'], 'mean_ms': stats['mean_s'] * 1e3}
+        for series, stats in extract.items()
+    }
+    results['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return results
+
+
+def report(results: dict):
+    for name in ('static', 'reviews', 'qa', 'output'):
+        stats = results[name]
+        print(f"[{name}] " + ' '.join(f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+                                      for key, value in stats.items()))
+    for series, stats in results['extractors'].items():
+        print(f"  {series:60} n={stats['count']:<6} mean={stats['mean_ms']:.3f}ms")
+    print(f"max_rss={results['max_rss_mb']:.1f}MB")
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    found = []
+    for section, checks in CHECKED.items():
+        for key, higher_is_better in checks.items():
+            old = baseline.get(section, {}).get(key)
+            new = results.get(section, {}).get(key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                found.append(f"{section}.{key}: {old:.2f} -> {new:.2f} ({change:+.0%})")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--copies', type=int, default=20, help="times each fixture product is scraped")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=0, help="extraction processes, 0 for one per core")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="delay added to every stand-in response")
+    parser.add_argument('--browser', action='store_true', help="also run the Q&A stage in Playwright's Firefox")
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--save', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="results JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    args.port = args.port or free_port()
+    args.base_url = f"http://127.0.0.1:{args.port}"
+    output_dir = tempfile.mkdtemp(prefix='bench-output-')
+    configure(args.base_url, output_dir, args.workers)
+
+    results = asyncio.run(run(args))
+    report(results)
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent=2), encoding='utf-8')
+
+    failures = [f"{name}: {stats['mismatches']} mismatched records"
+                for name, stats in results.items() if isinstance(stats, dict) and stats.get('mismatches')]
+    if args.baseline:
+        failures += regressions(results, json.loads(Path(args.baseline).read_text(encoding='utf-8')), args.tolerance)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Local HTTP stand-in for the Amazon pages the scrapers fetch, served from ``fixtures/``.
+
+    /dp/<ASIN>                           fixtures/product/*.html (by the ASIN in its .expected.json)
+    /product-reviews/<ASIN>/?pageNumber=N fixtures/reviews/<ASIN>_page<N>.html, 404 past the last page
+    /ask/questions/asin/<ASIN>/          fixtures/qa/<ASIN>.html
+    /ask/answers/<question id>           fixtures/answers/<question id>.html
+
+Every response can be delayed by ``latency`` seconds to stand in for the
+network. ``StubBrowserPool`` stands in for the browser pool where
+Playwright's Firefox is not installed. Run on its own to browse the fixtures:
+
+    python benchmarks/stand_in.py --port 8760
+"""
+import argparse
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from aiohttp import web
+
+FIXTURES = Path(__file__).resolve().parent / 'fixtures'
+
+
+def product_pages(fixtures: Path = FIXTURES) -> dict:
+    """ASIN -> product fixture page."""
+    pages = {}
+    for page in sorted((fixtures / 'product').glob('*.html')):
+        expected = json.loads(page.with_suffix('.expected.json').read_text(encoding='utf-8'))
+        pages[expected['ASIN']] = page
+    return pages
+
+
+def stand_in_app(fixtures: Path = FIXTURES, latency: float = 0.0) -> web.Application:
+    products = product_pages(fixtures)
+    cache = {}
+    hits = {}
+
+    def read(path: Path) -> str:
+        if path not in cache:
+            cache[path] = path.read_text(encoding='utf-8')
+        return cache[path]
+
+    async def serve(kind: str, path: Path) -> web.Response:
+        if latency:
+            await asyncio.sleep(latency)
+        if path is None or not path.exists():
+            return web.Response(status=404, text='Not found')
+        hits[kind] = hits.get(kind, 0) + 1
+        return web.Response(text=read(path), content_type='text/html', charset='utf-8')
+
+    async def product(request):
+        return await serve('product', products.get(request.match_info['asin'].upper()))
+
+    async def reviews(request):
+        page = request.query.get('pageNumber', '1')
+        return await serve('reviews', fixtures / 'reviews' / f"{request.match_info['asin']}_page{page}.html")
+
+    async def questions(request):
+        return await serve('qa', fixtures / 'qa' / f"{request.match_info['asin']}.html")
+
+    async def answers(request):
+        return await serve('answers', fixtures / 'answers' / f"{request.match_info['qid']}.html")
+
+    async def stats(request):
+        return web.json_response(hits)
+
+    app = web.Application()
+    app['hits'] = hits
+    app.add_routes([
+        web.get('/dp/{asin}', product),
+        web.get('/product-reviews/{asin}/', reviews),
+        web.get('/ask/questions/asin/{asin}/', questions),
+        web.get('/ask/answers/{qid}', answers),
+        web.get('/_stats', stats),
+    ])
+    return app
+
+
+async def start(host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                fixtures: Path = FIXTURES) -> web.AppRunner:
+    """Start the stand-in in the running loop; clean up the returned runner to stop it."""
+    runner = web.AppRunner(stand_in_app(fixtures, latency))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+class StubBrowserPool:
+    """A ``BrowserPool`` without a browser: every page it lends fails to load.
+
+    Product pages and reviews still come over HTTP, so a scrape goes end to
+    end with only its browser stages (Q&A, and any fallback) failing.
+    """
+
+    open_pages = 0
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def proxy_for(self, context):
+        return None
+
+    @asynccontextmanager
+    async def page(self, avoid=None):
+        raise RuntimeError("No browser in the stand-in")
+        yield
+
+    @asynccontextmanager
+    async def navigated(self, url: str, timeout: int, check_content: bool = False, governor=None):
+        raise RuntimeError(f"No browser in the stand-in for {url}")
+        yield
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8760)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    args = parser.parse_args()
+    web.run_app(stand_in_app(latency=args.latency_ms / 1000), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
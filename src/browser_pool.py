@@ -0,0 +1,283 @@
+import asyncio
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Optional
+
+from playwright.async_api import async_playwright
+
+import config
+from governor import BLOCKED, OK, RequestGovernor, get_governor
+from metrics import get_metrics
+from page_waits import goto_checked
+from proxy_pool import ProxyPool
+from request_blocker import RequestBlocker
+
+
+class _ContextSlot:
+    __slots__ = ('browser_index', 'context', 'pages_served', 'waiting', 'lock')
+
+    def __init__(self, browser_index: int):
+        self.browser_index = browser_index
+        self.context = None
+        self.pages_served = 0
+        self.waiting = 0  # borrowers queued on ``lock``
+        # held while the slot's context is replaced, so only this slot's borrowers wait for it
+        self.lock = asyncio.Lock()
+
+
+class BrowserPool:
+    """Long-lived Firefox browsers and contexts shared by the scrapers.
+
+    Pages are borrowed with ``async with pool.page() as page``. A borrowed page
+    goes to the least busy context; contexts are recycled after
+    ``max_pages_per_context`` pages and browsers that have crashed or
+    disconnected are relaunched the next time one of their contexts is used.
+
+    With a ``proxy_pool`` every context gets its own proxy from the pool, the
+    outcome of every navigation made with ``goto`` is reported back to it, and
+    a context whose proxy is cooled down or evicted is recycled onto another
+    one. Errors raised while a borrowed page is being read say nothing about
+    its proxy and are not reported. With a
+    ``request_blocker`` every new context gets its request interception.
+
+    Choosing a proxy, creating a context and relaunching a browser can all
+    take a while (``ProxyPool.choose`` waits out cooldowns), so they happen
+    under the lock of the one slot being refilled, or of the one browser
+    being relaunched, never a pool-wide lock. The slot bookkeeping has no
+    awaits in between, so it needs no lock on the event loop.
+    """
+
+    def __init__(self,
+                 num_browsers: int = config.NUM_BROWSERS,
+                 contexts_per_browser: int = config.CONTEXTS_PER_BROWSER,
+                 max_pages_per_context: int = config.MAX_PAGES_PER_CONTEXT,
+                 headless: bool = config.HEADLESS,
+                 proxy: Optional[dict] = None,
+                 proxy_pool: Optional[ProxyPool] = None,
+                 request_blocker: Optional[RequestBlocker] = None):
+        self.num_browsers = num_browsers
+        self.contexts_per_browser = contexts_per_browser
+        self.max_pages_per_context = max_pages_per_context
+        self.headless = headless
+        self.proxy = proxy
+        self.proxy_pool = proxy_pool
+        self.request_blocker = request_blocker
+
+        self._playwright = None
+        self._browsers = []
+        self._slots = []
+        self._open_pages = {}  # context -> number of pages currently borrowed from it
+        self._retiring = set()  # recycled contexts still serving borrowed pages
+        self._context_proxies = {}  # context -> Proxy from proxy_pool
+        self._browser_locks = []
+        self._lock = asyncio.Lock()  # start / close
+
+    def proxy_for(self, context) -> Optional[str]:
+        """Server of the proxy ``context`` goes through, if any."""
+        proxy = self._context_proxies.get(context)
+        if proxy is not None:
+            return proxy.server
+        return self.proxy['server'] if self.proxy else None
+
+    @property
+    def open_pages(self) -> int:
+        return sum(self._open_pages.values())
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def start(self):
+        async with self._lock:
+            if self._playwright is not None:
+                return
+            self._playwright = await async_playwright().start()
+            self._browsers = [await self._launch() for _ in range(self.num_browsers)]
+            self._browser_locks = [asyncio.Lock() for _ in range(self.num_browsers)]
+            self._slots = [_ContextSlot(i) for i in range(self.num_browsers)
+                           for _ in range(self.contexts_per_browser)]
+
+    async def _launch(self):
+        with get_metrics().timer('browser_launch'):
+            if self.proxy:
+                return await self._playwright.firefox.launch(proxy=self.proxy, headless=self.headless)
+            return await self._playwright.firefox.launch(headless=self.headless)
+
+    async def _relaunch(self, browser_index: int):
+        print(f"Browser {browser_index} is not connected, relaunching")
+        get_metrics().inc('scraper_browser_relaunches_total')
+        for slot in self._slots:
+            if slot.browser_index == browser_index:
+                self._release_proxy(slot.context)
+                self._open_pages.pop(slot.context, None)
+                self._retiring.discard(slot.context)
+                slot.context = None
+                slot.pages_served = 0
+        self._browsers[browser_index] = await self._launch()
+
+    def _release_proxy(self, context):
+        proxy = self._context_proxies.pop(context, None)
+        if proxy is not None:
+            self.proxy_pool.release(proxy, None, 0.0)
+
+    def _proxy_healthy(self, context) -> bool:
+        proxy = self._context_proxies.get(context)
+        return proxy is None or proxy.state() == 'healthy'
+
+    async def _close_context(self, context):
+        self._release_proxy(context)
+        self._open_pages.pop(context, None)
+        self._retiring.discard(context)
+        try:
+            await context.close()
+        except Exception as e:
+            print(f"Failed to close browser context: {e}")
+
+    async def _ensure_browser(self, browser_index: int):
+        if self._browsers[browser_index].is_connected():
+            return
+        async with self._browser_locks[browser_index]:
+            if not self._browsers[browser_index].is_connected():
+                await self._relaunch(browser_index)
+
+    async def _new_context(self, browser_index: int):
+        proxy = await self.proxy_pool.choose() if self.proxy_pool is not None else None
+        try:
+            with get_metrics().timer('context_create'):
+                if proxy is not None:
+                    context = await self._browsers[browser_index].new_context(proxy=proxy.settings())
+                else:
+                    context = await self._browsers[browser_index].new_context()
+            if self.request_blocker is not None:
+                await self.request_blocker.attach(context)
+        except BaseException:
+            if proxy is not None:
+                self.proxy_pool.release(proxy, None, 0.0)
+            raise
+        if proxy is not None:
+            self._context_proxies[context] = proxy
+        return context
+
+    async def _acquire_context(self, avoid=None):
+        """A context for one more page; never ``avoid`` (a context that was just blocked)."""
+        slot = min(self._slots, key=lambda s: (avoid is not None and s.context is avoid,
+                                               self._open_pages.get(s.context, 0) + s.waiting))
+        slot.waiting += 1
+        try:
+            async with slot.lock:
+                await self._ensure_browser(slot.browser_index)
+
+                if slot.context is not None and (slot.pages_served >= self.max_pages_per_context
+                                                 or not self._proxy_healthy(slot.context)
+                                                 or slot.context is avoid):
+                    old, slot.context = slot.context, None
+                    if self._open_pages.get(old, 0):
+                        self._retiring.add(old)
+                    else:
+                        await self._close_context(old)
+
+                if slot.context is None:
+                    context = await self._new_context(slot.browser_index)
+                    slot.context = context
+                    slot.pages_served = 0
+                    self._open_pages[context] = 0
+
+                slot.pages_served += 1
+                self._open_pages[slot.context] += 1
+                return slot.context
+        finally:
+            slot.waiting -= 1
+
+    async def _release_context(self, context):
+        if context not in self._open_pages:
+            # browser was relaunched while the page was out
+            return
+        self._open_pages[context] -= 1
+        if context in self._retiring and self._open_pages[context] == 0:
+            await self._close_context(context)
+
+    @asynccontextmanager
+    async def page(self, avoid=None):
+        if self._playwright is None:
+            await self.start()
+        context = await self._acquire_context(avoid)
+        page = None
+        try:
+            page = await context.new_page()
+            yield page
+        finally:
+            if page is not None:
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+            await self._release_context(context)
+
+    async def goto(self, page, url: str, timeout: int, check_content: bool = False):
+        """``goto_checked`` on a borrowed page, reporting the outcome to the proxy of its context."""
+        proxy = self._context_proxies.get(page.context)
+        start = time.perf_counter()
+        try:
+            content = await goto_checked(page, url, timeout=timeout, check_content=check_content)
+        except Exception as e:
+            if proxy is not None:
+                self.proxy_pool.record(proxy, RequestGovernor.classify(e), time.perf_counter() - start)
+            raise
+        if proxy is not None:
+            self.proxy_pool.record(proxy, OK, time.perf_counter() - start)
+        return content
+
+    @asynccontextmanager
+    async def navigated(self, url: str, timeout: int, check_content: bool = False,
+                        governor: Optional[RequestGovernor] = None):
+        """A borrowed page already at ``url``, as ``(page, content)``; ``content`` only with ``check_content``.
+
+        The navigation runs under the governor, paced by the bucket of the
+        proxy the borrowed context actually goes through. Every attempt gets a
+        fresh page, and after a blocked attempt the next one comes from
+        another context (with a proxy pool, normally on another proxy).
+        """
+        governor = governor or get_governor()
+        blocked = None
+        async with AsyncExitStack() as stack:
+            async def attempt():
+                nonlocal blocked
+                await stack.aclose()  # the page of the failed attempt
+                page = await stack.enter_async_context(self.page(avoid=blocked))
+                await governor.acquire_proxy(self.proxy_for(page.context))
+                try:
+                    return page, await self.goto(page, url, timeout, check_content)
+                except Exception as e:
+                    blocked = page.context if governor.classify(e) == BLOCKED else None
+                    raise
+
+            yield await governor.run(url, attempt)
+
+    async def close(self):
+        async with self._lock:
+            for context in list(self._open_pages) + list(self._retiring):
+                await self._close_context(context)
+            for browser in self._browsers:
+                try:
+                    await browser.close()
+                except Exception as e:
+                    print(f"Failed to close browser: {e}")
+            if self._playwright is not None:
+                await self._playwright.stop()
+            self._playwright = None
+            self._browsers = []
+            self._slots = []
+
+
+def proxy_settings(server: Optional[str], username: Optional[str] = None,
+                   password: Optional[str] = None) -> Optional[dict]:
+    if not server:
+        return None
+    return {
+        'server': server,
+        'username': username,
+        'password': password
+    }
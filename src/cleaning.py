@@ -1,36 +1,22 @@
-import re
-import json
 from pathlib import Path
+from typing import Iterator
 
-def load_json_data(filepath: Path):
-    with open(filepath, 'r') as f:
-        data = json.load(f)
-    return data
+import config
+from output_sink import iter_records
 
 
-def correct_json_file(input_file, output_file):
-    with open(input_file, 'r') as file:
-        content = file.read().strip()
-    
-    # Use a regular expression to insert a comma before '{' when it is directly followed by '"product_name"', accounting for any type and amount of whitespace between '}' and '{'
-    corrected_content = re.sub(r'}\s*(?=\s*{\s*"\s*product_name")', '},', content)
-    
-    # Wrap the whole content in square brackets to form a valid JSON array
-    corrected_content = f'[{corrected_content}]'
-    
-    with open(output_file, 'w') as file:
-        file.write(corrected_content)
+def iter_json_data(source) -> Iterator[dict]:
+    """Stream scraped records from a JSON Lines file, a glob or the sink's output directory."""
+    return iter_records(str(source))
+
+
+def load_json_data(filepath: Path):
+    return list(iter_json_data(filepath))
         
 def main():
-    ORIGINAL_PATH = './outputs/dirty.json'
-    NEW_PATH = 'total_clean_data.json'
-    correct_json_file(ORIGINAL_PATH, NEW_PATH )
-    a = load_json_data(NEW_PATH)
-    if a:
-        print('cleaning successful')
+    count = sum(1 for _ in iter_json_data(config.OUTPUT_DIR))
+    if count:
+        print(f'cleaning successful: {count} records')
     
 if __name__ == "__main__":
     main()
-    
-    
-    
\ No newline at end of file
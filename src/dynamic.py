@@ -1,29 +1,106 @@
 import asyncio
-import json
-import random
 import re
-import time
-from typing import Optional
-
-import lxml
-import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-from playwright.async_api import TimeoutError, async_playwright
+from typing import AsyncIterator, Optional
+
+from browser_pool import BrowserPool
+import config
+from extract_pool import ExtractionPool
+from fetch_stats import FetchStats
+from governor import RequestGovernor, get_governor
+from http_client import HttpClient
+from metrics import get_metrics
+from output_sink import QA_STREAM, REVIEW_STREAM, ChildStreams
+from records import Question, Review
+from page_waits import click_and_wait
+from review_crawler import ReviewCrawler
+from seen_ids import QUESTION, REVIEW, SeenIdStore
+from selector_spec import get_spec
+from snapshot_cache import REVIEWS, SnapshotCache
+
+# Reads every review on the page in one round trip; post-processing of the
+# raw strings happens in Python (see review_from_raw)
+REVIEWS_JS = """(elements, sel) => elements.map(el => {
+    const text = (css) => { const found = el.querySelector(css); return found ? found.innerText : null; };
+    return {
+        id: el.id,
+        title: text(sel.title),
+        text: text(sel.text),
+        rating: text(sel.rating),
+        meta: text(sel.meta),
+        helpful: text(sel.helpful),
+    };
+})"""
+
+QA_JS = """(elements, sel) => elements.map(el => {
+    const question = el.querySelector(sel.question);
+    const answer = el.querySelector(sel.answer);
+    const id = question ? question.id : null;
+    const qid = id ? id.slice(id.indexOf('-') + 1) : null;
+    const record = {id: id, qid: qid, question: null, answer: null, votes: null, all_answers_url: null};
+
+    if (answer) {
+        const content = answer.querySelector(sel.answer_long_text) || answer.querySelector(sel.answer_short_text);
+        if (content) record.answer = content.innerText;
+        const allAnswers = qid ? answer.querySelector(sel.see_all_answers.replace('{qid}', qid)) : null;
+        const link = allAnswers ? allAnswers.querySelector(sel.see_all_answers_link) : null;
+        if (link) record.all_answers_url = link.getAttribute('href');
+    }
+    const questionText = question ? question.querySelector(sel.question_text) : null;
+    if (questionText) record.question = questionText.innerText;
+    const votes = el.querySelector(sel.votes);
+    if (votes) record.votes = votes.innerText;
+    return record;
+})"""
+
+ANSWERS_JS = """(elements, sel) => elements.map(el => {
+    const content = el.querySelector(sel.answer_long_text) || el.querySelector(sel.answer_short_text);
+    return content ? content.innerText : null;
+})"""
 
 
 class DynamicScraper():
     def __init__(self, url: str, 
                 product_data:dict,
+                browser_pool: BrowserPool,
                 use_proxy: bool, 
                 proxy_ip: Optional[str] = None, 
                 username: Optional[str] = None, 
-                password: Optional[str] = None):
+                password: Optional[str] = None,
+                batch_extract: bool = config.BATCH_DOM_EXTRACT,
+                wait_stats: Optional[FetchStats] = None,
+                http_client: Optional[HttpClient] = None,
+                answer_concurrency: int = config.ANSWER_PAGE_CONCURRENCY,
+                asin: Optional[str] = None,
+                snapshot_cache: Optional[SnapshotCache] = None,
+                extract_pool: Optional[ExtractionPool] = None,
+                seen_ids: Optional[SeenIdStore] = None,
+                governor: Optional[RequestGovernor] = None,
+                child_streams: Optional[ChildStreams] = None,
+                scrape_id: Optional[str] = None):
         
         self.url = url
+        # may still be filling in while the dynamic stages run, see scraper.scrape_product
         self.product_data = product_data
-        self.needs_review = self.product_data['Needs Reviews']
-        self.asin = self.product_data['ASIN']
+        self.asin = asin or self.product_data['ASIN']
+        self.browser_pool = browser_pool
+        self.spec = get_spec()
+        # read each page with a single page.evaluate instead of per-element calls
+        self.batch_extract = batch_extract
+        # how long each pagination wait took, by wait label
+        self.wait_stats = wait_stats if wait_stats is not None else FetchStats()
+        # when given, review pages are fetched over plain HTTP first
+        self.http_client = http_client
+        self.answer_concurrency = answer_concurrency
+        # when given, every review page is kept for re-extraction
+        self.snapshot_cache = snapshot_cache
+        # when given, review pages fetched over HTTP are parsed in worker processes
+        self.extract_pool = extract_pool
+        # when given, only reviews and questions not in the store are scraped
+        self.seen_ids = seen_ids
+        self.governor = governor or get_governor()
+        # when given, reviews and Q&A go to the child streams page by page instead of into product_data
+        self.child_streams = child_streams
+        self.scrape_id = scrape_id
         
         self.use_proxy = use_proxy
         
@@ -32,104 +109,108 @@ class DynamicScraper():
             self.proxy_ip = proxy_ip
             self.password = password
             self.username = username
-            
-        # self.browser = self.set_browser()
         
-    # Define request retry functionality with a maximum retry limit.
-    async def perform_request_with_retry(self, page, url):
-    # set max retries
-        MAX_RETRIES = 5
-        # initialize retry counter
-        retry_count = 0
-        # loop until maximum retries are reached
-        while retry_count < MAX_RETRIES:
-            try:
-            # try to make a request to the URL using the page object and a timeout of 30 seconds.
-                await page.goto(url, timeout = 80000)
-            # break the while loop if the request was successful.
-                break
-            except:
-            # if an exception occurs, increment the retry counter
-                retry_count += 1
-            # if maximum retries have been reached, raise an exception
-                if retry_count == MAX_RETRIES:
-                    raise Exception("Maximum retries reached")
-            # wait for a random amount of time between 1 and 5 seconds before retrying
-            await asyncio.sleep(random.randint(1, 5))
+    @property
+    def needs_review(self) -> bool:
+        return self.product_data.get('Needs Reviews', True)
+
+    # A borrowed page navigated through the shared request governor, which paces and retries the request.
+    def page_at(self, url):
+        return self.browser_pool.navigated(url, timeout=80000, governor=self.governor)
         
     def get_qa_url(self):
-        return(f"https://www.amazon.com/ask/questions/asin/{self.asin}/")
+        return(f"{config.AMAZON_BASE_URL}/ask/questions/asin/{self.asin}/")
     
     async def scrape_question_page(self, url):
-        async with async_playwright() as pw:
-            if self.use_proxy:
-                proxy = {
-                    'server': self.proxy_ip,
-                    'username': self.username,
-                    'password': self.password
-                }
-                browser = await pw.firefox.launch(proxy=proxy, headless= True)
-            else:
-                browser = await pw.firefox.launch(headless = True)
-            # browser = await pw.firefox.launch(headless=True)
-            
-            page = await browser.new_page()
-            await self.perform_request_with_retry(page, url)
+        async with self.page_at(url) as (page, _):
             answers = []
 
-            answers_section = await page.query_selector('.a-section.a-spacing-large.askAnswersAndComments.askWrapText')
-            answer_blocks = await answers_section.query_selector_all('.a-section.a-spacing-medium')
-            for block in answer_blocks:
-                answer_content_block = await block.query_selector('.askLongText')
-                if not answer_content_block:
-                    answer_content_block = await block.query_selector('span')
-                answer_text = await answer_content_block.inner_text()
-                answers.append(answer_text)
+            if self.batch_extract:
+                answers = await self.extract_answers_batch(page)
+            else:
+                answers_section = await page.query_selector(self.spec.css('answers', 'answers_section'))
+                answer_blocks = await answers_section.query_selector_all(self.spec.css('answers', 'answer_block'))
+                for block in answer_blocks:
+                    answer_content_block = await block.query_selector(self.spec.css('answers', 'answer_long_text'))
+                    if not answer_content_block:
+                        answer_content_block = await block.query_selector(self.spec.css('answers', 'answer_short_text'))
+                    answer_text = await answer_content_block.inner_text()
+                    answers.append(answer_text)
             print('answers added')
 
-            next_button = await page.query_selector('.a-last')
+            next_button = await page.query_selector(self.spec.css('answers', 'next_page'))
             if next_button and await next_button.is_enabled():
-                await next_button.click()
                 print('question next button pressed')
-                await asyncio.sleep(5)  # Ensure new page has loaded
+                await click_and_wait(page, next_button, self.spec.css('answers', 'answer_block'),
+                                     label='answers_next', stats=self.wait_stats)
 
                     
-        await browser.close()
         return answers
 
 
         
-    async def get_product_qa(self):
+    async def get_all_answers(self, all_answers_urls: dict) -> dict:
+        """Fetch "see all answers" pages concurrently.
+
+        Args:
+            all_answers_urls (dict): question ID -> all answers page URL
+
+        Returns:
+            dict: question ID -> answers, for every page that was scraped
+        """
+        semaphore = asyncio.Semaphore(self.answer_concurrency)
+
+        async def fetch(qid, url):
+            async with semaphore:
+                try:
+                    return qid, await self.scrape_question_page(url)
+                except Exception as e:
+                    print(f"{e} at all answers for {qid}")
+                    return qid, None
+
+        results = await asyncio.gather(*(fetch(qid, url) for qid, url in all_answers_urls.items()))
+        return {qid: answers for qid, answers in results if answers is not None}
+
+    def known_ids(self, kind: str) -> Optional[set]:
+        return self.seen_ids.load(self.asin, kind) if self.seen_ids is not None else None
+
+    async def get_product_qa(self, known_ids: Optional[set] = None):
+        return [qa async for batch in self.iter_product_qa(known_ids) for qa in batch]
+
+    async def iter_product_qa(self, known_ids: Optional[set] = None) -> AsyncIterator[list]:
+        """New questions one page at a time, each with its "see all answers" answers attached."""
         qa_url = self.get_qa_url()
-        async with async_playwright() as pw:
-            if self.use_proxy:
-                proxy = {
-                    'server': self.proxy_ip,
-                    'username': self.username,
-                    'password': self.password
-                }
-                browser = await pw.firefox.launch(proxy=proxy, headless= True)
-            else:
-                browser = await pw.firefox.launch(headless = True)
-            # browser = await pw.firefox.launch(headless=True)
-            page = await browser.new_page()
-            await self.perform_request_with_retry(page, qa_url)
+        async with self.page_at(qa_url) as (page, _):
 
-            scrape_info = []
-            unique_qa_ids = set()  # Set to store unique qa IDs
+            unique_qa_ids = {f"question-{qid}" for qid in known_ids or ()}  # Set to store unique qa IDs
             qa_added = True
 
             while qa_added:
                 qa_added = False
-                qa_section = await page.query_selector('.a-section.askTeaserQuestions')
-                selected_elements = await qa_section.query_selector_all('.a-fixed-left-grid.a-spacing-base')
+                scrape_info = []
+                qa_by_id = {}
+                all_answers_urls = {}  # question ID -> "see all answers" page, fetched once the page is read
+                if self.batch_extract:
+                    for raw in await self.extract_qa_batch(page):
+                        if raw['id'] and raw['id'].startswith("question") and raw['id'] not in unique_qa_ids:
+                            unique_qa_ids.add(raw['id'])
+                            qa_added = True
+                            qa_details = self.qa_from_raw(raw)
+                            qa_by_id[raw['qid']] = qa_details
+                            if raw['all_answers_url']:
+                                all_answers_urls[raw['qid']] = f"{config.AMAZON_BASE_URL}{raw['all_answers_url']}"
+                            scrape_info.append(qa_details)
+                    selected_elements = []
+                else:
+                    qa_section = await page.query_selector(self.spec.css('qa', 'questions_section'))
+                    selected_elements = await qa_section.query_selector_all(self.spec.css('qa', 'question_block'))
 
                 for element in selected_elements:
                     
-                    question_element = await element.query_selector('.a-fixed-left-grid.a-spacing-small')
+                    question_element = await element.query_selector(self.spec.css('qa', 'question'))
 
                     try:
-                        answer_element = await element.query_selector('.a-fixed-left-grid.a-spacing-base .a-fixed-left-grid-col.a-col-right')
+                        answer_element = await element.query_selector(self.spec.css('qa', 'answer'))
                     except:
                         pass
 
@@ -147,10 +228,10 @@ class DynamicScraper():
 
                             # Scrape top answer
                             if answer_element:
-                                answer_element_cont = await answer_element.query_selector('.askLongText')
+                                answer_element_cont = await answer_element.query_selector(self.spec.css('qa', 'answer_long_text'))
 
                                 if not answer_element_cont:
-                                    answer_element_cont = await answer_element.query_selector('span')
+                                    answer_element_cont = await answer_element.query_selector(self.spec.css('qa', 'answer_short_text'))
 
                                 if answer_element_cont:
                                     qa_details['answer'] = await answer_element_cont.inner_text()  
@@ -158,34 +239,37 @@ class DynamicScraper():
 
 
                             # Scrape question text                
-                            question_text_element = await question_element.query_selector('.a-declarative')
+                            question_text_element = await question_element.query_selector(self.spec.css('qa', 'question_text'))
                             if question_element:
                                 qa_details['question'] = await question_text_element.inner_text()
 
                             
                             # Scrape votes for question
-                            vote_element = await element. query_selector('.count')
+                            vote_element = await element.query_selector(self.spec.css('qa', 'votes'))
                             if vote_element:
                                 qa_details['votes'] = await vote_element.inner_text()  
+                            qa_details['question_id'] = qid_str
 
 
                             try:
                             # Scrape multiple answers if present
-                                all_answers_div_cont = await answer_element.query_selector(f'#askSeeAllAnswersLink-{qid_str}')
-                                all_answers_div = await all_answers_div_cont.query_selector('.a-link-normal')
+                                all_answers_div_cont = await answer_element.query_selector(self.spec.css('qa', 'see_all_answers', qid=qid_str))
+                                all_answers_div = await all_answers_div_cont.query_selector(self.spec.css('qa', 'see_all_answers_link'))
                                 if all_answers_div:
 
                                     
                                     all_answers_url = await all_answers_div.get_attribute('href')
                                     print(all_answers_url)
-                                    answers = await self.scrape_question_page(f'https://www.amazon.com{all_answers_url}')
-                                    qa_details['all_answers'] = answers
+                                    all_answers_urls[qid_str] = f'{config.AMAZON_BASE_URL}{all_answers_url}'
                             except:
                                 pass
 
+                            qa_item = Question.parse(qid_str, qa_details.get('question'),
+                                                     qa_details.get('answer'), qa_details.get('votes'))
+                            qa_by_id[qid_str] = qa_item
+                            scrape_info.append(qa_item)
                     except:
                         pass
-                        scrape_info.append(qa_details)
 
                         
                         # BREAK LOOP FOR TESTING PURPOSES
@@ -197,15 +281,17 @@ class DynamicScraper():
                 if not qa_added:
                     break
 
-                next_button = await page.query_selector('.a-last')
+                for qid, answers in (await self.get_all_answers(all_answers_urls)).items():
+                    qa_by_id[qid].all_answers = answers
+                yield scrape_info
+
+                next_button = await page.query_selector(self.spec.css('qa', 'next_page'))
                 if next_button and await next_button.is_enabled():
-                    await next_button.click()
-                    await asyncio.sleep(5)  # Ensure new page has loaded
+                    await click_and_wait(page, next_button,
+                                         f"{self.spec.css('qa', 'questions_section')} {self.spec.css('qa', 'question')}",
+                                         label='qa_next', stats=self.wait_stats)
                 else:
                     break
-                    
-        await browser.close()
-        return scrape_info
     
     def dedup_qa(self, data:list)->list:
         """_summary_
@@ -217,36 +303,85 @@ class DynamicScraper():
             dedup_data(list): deduplicated QA
         """
         ques = set()
-        dedup_data = [i for i in data if i['question'] not in ques and not ques.add(i['question'])]
+        dedup_data = [i for i in data if i.question not in ques and not ques.add(i.question)]
         return dedup_data
         
 
-    async def get_product_reviews(self):
-        async with async_playwright() as pw:
-            if self.use_proxy:
-                proxy = {
-                    'server': self.proxy_ip,
-                    'username': self.username,
-                    'password': self.password
-                }
-                browser = await pw.firefox.launch(proxy=proxy, headless= True)
-            else:
-                browser = await pw.firefox.launch(headless = True)
-            # browser = await pw.firefox.launch(headless=True)
-            page = await browser.new_page()
-            await self.perform_request_with_retry(page, self.url)
-            scrape_info = []
-            unique_review_ids = set()  # Set to store unique review IDs
+    async def extract_review_batch(self, page) -> list:
+        return await page.eval_on_selector_all(self.spec.css('reviews', 'review'), REVIEWS_JS,
+                                               self.spec.css_sections['reviews'])
+
+    async def extract_qa_batch(self, page) -> list:
+        block = f"{self.spec.css('qa', 'questions_section')} {self.spec.css('qa', 'question_block')}"
+        return await page.eval_on_selector_all(block, QA_JS, self.spec.css_sections['qa'])
+
+    async def extract_answers_batch(self, page) -> list:
+        block = f"{self.spec.css('answers', 'answers_section')} {self.spec.css('answers', 'answer_block')}"
+        answers = await page.eval_on_selector_all(block, ANSWERS_JS, self.spec.css_sections['answers'])
+        return [answer for answer in answers if answer is not None]
+
+    def review_from_raw(self, raw: dict) -> Review:
+        return Review.parse(raw['id'], re.search(r'\n(.+)', raw['title']).group(1), raw['text'],
+                            raw['rating'], raw['meta'], raw['helpful'])
+
+    def qa_from_raw(self, raw: dict) -> Question:
+        return Question.parse(raw['qid'], raw['question'], raw['answer'], raw['votes'])
+
+    async def get_product_reviews(self, known_ids: Optional[set] = None):
+        return [review async for batch in self.iter_product_reviews(known_ids) for review in batch]
+
+    async def iter_product_reviews(self, known_ids: Optional[set] = None) -> AsyncIterator[list]:
+        """New reviews one page at a time, over HTTP when possible and in the browser otherwise.
+
+        If the HTTP crawl fails partway, the browser picks up without repeating
+        the reviews already yielded.
+        """
+        seen_ids = set(known_ids or ())
+        if self.http_client is not None:
+            try:
+                # newest first, so an incremental crawl can stop at the first page it has seen
+                sort = config.INCREMENTAL_REVIEW_SORT if known_ids is not None else config.REVIEW_SORT
+                crawler = ReviewCrawler(self.http_client, self.spec, sort=sort,
+                                        snapshot_cache=self.snapshot_cache, extract_pool=self.extract_pool)
+                found = False
+                async for batch in crawler.iter_pages(self.asin, known_ids):
+                    found = True
+                    seen_ids.update(review.review_id for review in batch)
+                    yield batch
+                if found or known_ids:
+                    return
+                print(f"No reviews over HTTP for {self.asin}, falling back to browser")
+            except Exception as e:
+                print(f"{e} at HTTP reviews, falling back to browser")
+        async for batch in self.iter_product_reviews_in_browser(seen_ids):
+            yield batch
+
+    async def iter_product_reviews_in_browser(self, known_ids: Optional[set] = None) -> AsyncIterator[list]:
+        async with self.page_at(self.url) as (page, _):
+            unique_review_ids = set(known_ids or ())  # Set to store unique review IDs
             reviews_added = True
+            page_number = 0
 
-            first_button = await page.query_selector('.a-link-emphasis.a-text-bold')
+            first_button = await page.query_selector(self.spec.css('reviews', 'see_all_reviews'))
             if first_button:
-                await first_button.click()
-                await asyncio.sleep(5)  
+                await click_and_wait(page, first_button, self.spec.css('reviews', 'review'),
+                                     label='see_all_reviews', stats=self.wait_stats)
 
             while reviews_added:
                 reviews_added = False
-                selected_elements = await page.query_selector_all('.a-section.review.aok-relative')
+                scrape_info = []
+                page_number += 1
+                if self.snapshot_cache is not None:
+                    self.snapshot_cache.put(REVIEWS, self.asin, page_number, page.url, await page.content())
+                if self.batch_extract:
+                    for raw in await self.extract_review_batch(page):
+                        if raw['id'].startswith("R") and raw['id'] not in unique_review_ids:
+                            unique_review_ids.add(raw['id'])
+                            reviews_added = True
+                            scrape_info.append(self.review_from_raw(raw))
+                    selected_elements = []
+                else:
+                    selected_elements = await page.query_selector_all(self.spec.css('reviews', 'review'))
                 for element in selected_elements:
                     review_id = await element.get_attribute('id')  # Get the ID attribute of the review div 
                     
@@ -258,13 +393,13 @@ class DynamicScraper():
                         # Scrape review details
                         review_details = {}
 
-                        review_title_element = await element.query_selector('.a-size-base.review-title.a-text-bold:not(span.a-icon-alt)')
-                        review_text_element = await element.query_selector('.a-size-base.review-text.review-text-content')
-                        review_rating_element = await element.query_selector(".a-icon-alt")
-                        review_meta_element = await element.query_selector(".a-size-base.a-color-secondary.review-date")
+                        review_title_element = await element.query_selector(self.spec.css('reviews', 'title'))
+                        review_text_element = await element.query_selector(self.spec.css('reviews', 'text'))
+                        review_rating_element = await element.query_selector(self.spec.css('reviews', 'rating'))
+                        review_meta_element = await element.query_selector(self.spec.css('reviews', 'meta'))
                         
                         try:
-                            review_helpfulness_element = await element.query_selector(".a-size-base.a-color-tertiary.cr-vote-text")
+                            review_helpfulness_element = await element.query_selector(self.spec.css('reviews', 'helpful'))
                             if review_helpfulness_element:
                                 review_details['helpful'] = await review_helpfulness_element.inner_text()
                         except: 
@@ -276,64 +411,62 @@ class DynamicScraper():
                         
                         review_details['text'] = await review_text_element.inner_text()
                         rating_text = await review_rating_element.inner_text()
-                        review_details['ratings'] = str(rating_text)[:3]
+                        review_details['ratings'] = str(rating_text)
                         review_details['meta'] = await review_meta_element.inner_text()
+                        review_details['review_id'] = review_id
 
-                        scrape_info.append(review_details)
+                        scrape_info.append(Review.parse(review_id, review_details['title'], review_details['text'],
+                                                        review_details['ratings'], review_details['meta'],
+                                                        review_details.get('helpful')))
                         # print(len(scrape_info))
                         # if len(scrape_info) == 50:
                         #     return scrape_info
                 
                 if not reviews_added:
                     break
+                yield scrape_info
 
-                next_button = await page.query_selector('.a-last')
+                next_button = await page.query_selector(self.spec.css('reviews', 'next_page'))
                 if next_button and await next_button.is_enabled():
-                    await next_button.click()
-                    await asyncio.sleep(5)  # Ensure new page has loaded
+                    await click_and_wait(page, next_button, self.spec.css('reviews', 'review'),
+                                         label='reviews_next', stats=self.wait_stats)
                 else:
                     break
-                    
-        await browser.close()
-        return scrape_info
-
-    # async def set_browser(self) -> None:
-    #     async with async_playwright() as pw:
-    #         if self.use_proxy:
-    #                 proxy = {
-    #                     'server': self.proxy_ip,
-    #                     'username': self.username,
-    #                     'password': self.password
-    #                 }
-    #                 browser = await pw.firefox.launch(proxy=proxy, headless= True)
-    #         else:
-    #             browser = await pw.firefox.launch(headless = True)
-            
-    #         browser = browser
-                
-                
-    async def run_dynamic_scraper(self):
+
+    async def stream_batches(self, kind: str, batches: AsyncIterator[list]):
+        """Write each batch to the child streams as it arrives; the record only keeps the count."""
+        count_key = f"{kind}_count"
+        self.product_data[count_key] = 0
+        async for batch in batches:
+            self.child_streams.write(kind, self.asin, self.scrape_id, batch)
+            self.product_data[count_key] += len(batch)
+
+    async def deduped_qa(self, batches: AsyncIterator[list]) -> AsyncIterator[list]:
+        """``dedup_qa`` across batches."""
+        questions = set()
+        async for batch in batches:
+            yield [qa for qa in batch if qa.question not in questions and not questions.add(qa.question)]
+
+    async def run_reviews_stage(self):
         # if self.needs_review:
         try:
-            self.product_data['Reviews'] = await self.get_product_reviews()
+            if self.child_streams is not None:
+                await self.stream_batches(REVIEW_STREAM, self.iter_product_reviews(self.known_ids(REVIEW)))
+            else:
+                self.product_data['Reviews'] = await self.get_product_reviews(self.known_ids(REVIEW))
         except Exception as e:
             print (f"{e} at reviews")
+            get_metrics().inc('scraper_stage_failures_total', stage='reviews')
             pass
-            
+
+    async def run_qa_stage(self):
         try:
-            qa = await self.get_product_qa()
-            self.product_data['QA'] = self.dedup_qa(qa)
+            if self.child_streams is not None:
+                await self.stream_batches(QA_STREAM, self.deduped_qa(self.iter_product_qa(self.known_ids(QUESTION))))
+            else:
+                qa = await self.get_product_qa(self.known_ids(QUESTION))
+                self.product_data['QA'] = self.dedup_qa(qa)
         except Exception as e:
             print (f"{e} at qa")
+            get_metrics().inc('scraper_stage_failures_total', stage='qa')
             pass
-        
-        self.product_data['fully_scraped'] = True
-        # try:
-        #     await browser.close()
-        # except Exception as e:
-        #     print (f"{e} at closing")
-        
-        return self.product_data
-        
-        
-        
\ No newline at end of file
@@ -0,0 +1,82 @@
+import asyncio
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator
+
+import config
+from extraction import ProductExtractor, ReviewPageExtractor
+from metrics import get_metrics
+
+
+def available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# Run inside the worker processes; each worker loads (and hot-reloads) the selector spec itself.
+# Step timings travel back with the result, metrics live in the parent process.
+def extract_product(content: str, url: str) -> tuple:
+    extractor = ProductExtractor(content, url)
+    return extractor.extract(), extractor.timings
+
+
+def extract_review_page(content: str, url: str) -> tuple:
+    extractor = ReviewPageExtractor(content, url)
+    return extractor.timed('reviews', extractor.reviews), extractor.timings
+
+
+class ExtractionPool:
+    """Process pool for the CPU-bound HTML parsing, off the event loop.
+
+    At most ``max_pending`` pages are queued or being parsed at once; callers
+    past that wait for a slot, which in turn holds back their fetch stage
+    instead of piling HTML up in memory.
+    """
+
+    def __init__(self,
+                 workers: int = config.EXTRACT_WORKERS,
+                 max_pending: int = config.EXTRACT_MAX_PENDING):
+        self.workers = workers or available_cores()
+        self.max_pending = max_pending or self.workers * 2
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self._slots = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    async def run(self, fn: Callable, *args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        async with self._slots:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def extract_product(self, content: str, url: str) -> dict:
+        with get_metrics().timer('extract_product'):
+            product_data, timings = await self.run(extract_product, content, url)
+        get_metrics().record_timings('extract', timings)
+        return product_data
+
+    async def extract_review_page(self, content: str, url: str) -> list:
+        with get_metrics().timer('extract_review_page'):
+            reviews, timings = await self.run(extract_review_page, content, url)
+        get_metrics().record_timings('extract', timings)
+        return reviews
+
+    def imap(self, fn: Callable, items: Iterable) -> Iterator:
+        """Ordered ``map(fn, items)`` over the pool, with at most ``max_pending`` items submitted."""
+        pending = deque()
+        for item in items:
+            if len(pending) >= self.max_pending:
+                yield pending.popleft().result()
+            pending.append(self.executor.submit(fn, item))
+        while pending:
+            yield pending.popleft().result()
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
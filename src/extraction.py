@@ -0,0 +1,321 @@
+import re
+import time
+from collections import defaultdict
+from typing import Optional
+
+from lxml import etree
+
+from records import Review
+from selector_spec import POST_PROCESSORS, SelectorSpec, get_spec
+
+# Text inside these elements is not page text (matches BeautifulSoup's get_text)
+NON_TEXT_TAGS = frozenset(('script', 'style', 'template', 'rt', 'rp'))
+BLOCK_TAGS = frozenset(('div', 'p', 'li', 'ul', 'ol', 'table', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'))
+
+OVERALL_RANK_RE = re.compile(r'^(.*?)\(')
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def parse_html(content) -> etree._Element:
+    return etree.fromstring(content, etree.HTMLParser())
+
+
+def iter_strings(element):
+    if isinstance(element.tag, str) and element.tag not in NON_TEXT_TAGS:
+        if element.text:
+            yield element.text
+        for child in element:
+            yield from iter_strings(child)
+            if child.tail:
+                yield child.tail
+
+
+def get_text(element, strip: bool = False) -> str:
+    if strip:
+        return ''.join(s.strip() for s in iter_strings(element) if s.strip())
+    return ''.join(iter_strings(element))
+
+
+def only_string(element) -> Optional[str]:
+    """The single string directly inside ``element``, like bs4's ``Tag.string``."""
+    children = list(element)
+    if not children:
+        return element.text
+    if len(children) == 1 and not element.text and not children[0].tail:
+        return only_string(children[0])
+    return None
+
+
+def inner_text(element) -> str:
+    """Approximates the browser's ``innerText``: collapsed whitespace, line breaks at <br> and blocks."""
+    parts = []
+
+    def block_break():
+        if parts and not parts[-1].endswith('\n'):
+            parts.append('\n')
+
+    def walk(node):
+        if not isinstance(node.tag, str) or node.tag in NON_TEXT_TAGS:
+            return
+        if node.tag == 'br':
+            parts.append('\n')
+            return
+        if node.tag in BLOCK_TAGS:
+            block_break()
+        if node.text:
+            parts.append(WHITESPACE_RE.sub(' ', node.text))
+        for child in node:
+            walk(child)
+            if child.tail:
+                parts.append(WHITESPACE_RE.sub(' ', child.tail))
+        if node.tag in BLOCK_TAGS:
+            block_break()
+
+    walk(element)
+    return '\n'.join(line.strip() for line in ''.join(parts).split('\n')).strip()
+
+
+def last_content(element):
+    """The last child node of ``element``: a trailing string or the last child element."""
+    children = list(element)
+    if not children:
+        return element.text
+    return children[-1].tail or children[-1]
+
+
+class PageExtractor:
+    """A page parsed once with lxml, read with the selectors of one spec section.
+
+    ``timings`` holds the seconds spent parsing and in each timed step.
+    """
+
+    section = None
+
+    def __init__(self, content, url: str = '', spec: Optional[SelectorSpec] = None):
+        self.url = url
+        self.spec = spec or get_spec()
+        start = time.perf_counter()
+        self.root = parse_html(content)
+        self.ids = {}
+        for element in self.root.iter(tag=etree.Element):
+            element_id = element.get('id')
+            if element_id is not None and element_id not in self.ids:
+                self.ids[element_id] = element
+        self.timings = {'parse': time.perf_counter() - start}
+
+    def timed(self, name: str, step, *args):
+        start = time.perf_counter()
+        try:
+            return step(*args)
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def select(self, name: str, context=None) -> list:
+        return self.spec.selector(name, self.section).select(self.root if context is None else context, self.ids)
+
+    def first(self, name: str, context=None):
+        found = self.select(name, context)
+        return found[0] if found else None
+
+    def field(self, name: str, context=None):
+        rule = self.spec.field(name, self.section)
+        for selector in rule.selectors:
+            found = selector.select(self.root if context is None else context, self.ids)
+            if found:
+                break
+        else:
+            if rule.required:
+                raise LookupError(f"{name} not found on {self.url}")
+            return rule.default
+
+        value = found[0]
+        for step in rule.post:
+            if step == 'text':
+                value = get_text(value)
+            elif step == 'text_strip':
+                value = get_text(value, strip=True)
+            else:
+                value = POST_PROCESSORS[step](value)
+        return value
+
+
+class ProductExtractor(PageExtractor):
+    """Extracts the static ``product_data`` record from a product page.
+
+    ``extract`` returns exactly what the BeautifulSoup based StaticScraper
+    returned.
+    """
+
+    section = 'product'
+
+    def get_product_name(self):
+        title = self.field('product_name')
+        if title is None:
+            print(f"Failed to fetch title for {self.url}.")
+        return title
+
+    def get_about_product(self):
+        about_section = self.first('feature_bullets')
+        if about_section is None:
+            about_section = self.first('visual_description')
+            if about_section is None:
+                return None
+            # only the first visual description block is kept
+            for element in self.select('about_visual_text', about_section):
+                return [get_text(element)]
+            return None
+        return [get_text(item).strip() for item in self.select('about_bullets', about_section)]
+
+    def get_price_details(self):
+        table = self.first('price_table')
+        if table is None:
+            return None
+        outer_span = self.first('unit_price_span', table)
+        first_span_text = get_text(self.first('offscreen', outer_span), strip=True)
+        outer_span_text = last_content(outer_span).strip()[:-1]
+        unit_price = first_span_text + ' ' + outer_span_text
+
+        price_element = self.first('price_to_pay', table)
+        price = get_text(self.first('offscreen_span', price_element), strip=True)
+
+        return {'total price': price,
+                'unit price': unit_price
+                }
+
+    def get_product_details(self) -> dict:
+        pdt_details = self.first('product_details')
+        if pdt_details is None:
+            return None
+
+        table_values = {}
+        for tr in self.select('rows', pdt_details):
+            key = get_text(self.first('details_key_cell', tr)).strip()
+            value = get_text(self.first('details_value_cell', tr)).strip()
+            table_values[key] = value
+        return table_values
+
+    def get_amazon_details(self):
+        details = {}
+        details_section = self.first('amazon_details')
+        if details_section is None:
+            return None
+
+        for li in self.select('list_items', self.first('detail_bullets')):
+            key_element = self.first('bold_span', li)
+            key = get_text(key_element, strip=True).replace('\u200f', '').replace('\u200e', '').strip()
+            key = WHITESPACE_RE.sub(' ', key)[:-2]
+            value = get_text(self.first('next_span', key_element), strip=True).strip()
+            details[key] = value
+
+        rank_label = self.spec.selector('rank_label').text
+        rank_sec = next(span for span in self.select('rank_label', details_section)
+                        if only_string(span) == rank_label)
+        rank_parent = rank_sec.getparent()
+        overall_rank = OVERALL_RANK_RE.search(get_text(rank_parent, strip=True)).group(1)
+        subranks = [get_text(self.select('list_item_span', rank_parent)[0])]
+
+        details['avg_rating'] = self.field('avg_rating', details_section)
+        details['num_ratings'] = self.field('num_ratings')
+        details['overall rank'] = overall_rank
+        details['subranks'] = subranks
+        return details
+
+    def get_ai_sentiments(self) -> dict:
+        kv_pairs = {}
+        for button in self.select('aspect_buttons'):
+            name = get_text(self.first('aspect_name', button), strip=True)
+            aria_desc = button.get('aria-describedby')
+            if aria_desc:
+                value_parts = aria_desc.split("_")[-1].split()
+                kv_pairs[name] = value_parts[0] if value_parts else ""
+            else:
+                kv_pairs[name] = "No value"
+        return kv_pairs
+
+    def get_ai_summary(self) -> str:
+        return self.field('ai_summary')
+
+    def get_climate_pledge_badges(self):
+        badges_area = self.first('climate_badges')
+        cert_map = defaultdict(list)
+        if badges_area is None:
+            return cert_map
+
+        cert_area = self.select('badge_links', badges_area)
+        text_area = self.select('badge_titles', badges_area)
+        for i in range(len(text_area)):
+            cert_map[get_text(text_area[i])] = [get_text(cert_area[i])]
+
+        cert_levels = []
+        pop_element = self.first('badge_popover')
+        if pop_element is not None:
+            cert_levels = [get_text(el) for el in self.select('badge_levels', pop_element)]
+
+        c2c_count = 0
+        for values in cert_map.values():
+            for value in values:
+                if value == " Cradle to Cradle Certified ":
+                    values.append(cert_levels[c2c_count])
+                    c2c_count += 1
+        return cert_map
+
+    def check_amazon_choice(self):
+        return bool(self.select('choice_badge'))
+
+    def extract(self) -> dict:
+        timed = self.timed
+        product_data = {}
+        product_data['product_name'] = timed('get_product_name', self.get_product_name)
+        product_data['about_items'] = timed('get_about_product', self.get_about_product)
+        product_data['price'] = timed('get_price_details', self.get_price_details)
+        product_data['amazon choice'] = timed('check_amazon_choice', self.check_amazon_choice)
+        product_data.update(timed('get_product_details', self.get_product_details))
+        product_data.update(timed('get_amazon_details', self.get_amazon_details))
+
+        if self.first('climate_badges') is not None:
+            badges = timed('get_climate_pledge_badges', self.get_climate_pledge_badges)
+            product_data['Climate Pledge Badges'] = badges
+            product_data['Number of Badges'] = len(badges)
+
+        if self.first('insights_cards') is not None:
+            product_data['AI Sentiments'] = timed('get_ai_sentiments', self.get_ai_sentiments)
+            product_data['AI Summary'] = timed('get_ai_summary', self.get_ai_summary)
+            product_data['Needs Reviews'] = False
+        else:
+            product_data['Needs Reviews'] = True
+
+        product_data['fully_scraped'] = False
+        return product_data
+
+
+class ReviewPageExtractor(PageExtractor):
+    """Reads the review records off a product-reviews page.
+
+    Produces the same Review records as the browser-driven
+    DynamicScraper.get_product_reviews.
+    """
+
+    section = 'review_page'
+
+    def text_of(self, name: str, context):
+        element = self.first(name, context)
+        return inner_text(element) if element is not None else None
+
+    def reviews(self) -> list:
+        """``(review_id, record)`` for every review on the page."""
+        found = []
+        for element in self.select('review'):
+            review_id = element.get('id') or ''
+            if not review_id.startswith('R'):
+                continue
+
+            title_element = self.first('title', element)
+            title = inner_text(title_element)
+            title_rating = self.first('title_rating', title_element)
+            if title_rating is not None:
+                title = title.replace(inner_text(title_rating), '', 1)
+            review = Review.parse(review_id, title.strip(), self.text_of('text', element),
+                                  self.text_of('rating', element), self.text_of('meta', element),
+                                  self.text_of('helpful', element))
+            found.append((review_id, review))
+        return found
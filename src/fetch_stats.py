@@ -0,0 +1,48 @@
+from collections import defaultdict, deque
+
+
+class FetchStats:
+    """Per mode outcome counts and latencies.
+
+    For page fetches a mode is how the page was fetched (``http`` or
+    ``browser``) and the outcome is ``hit``, ``escalated`` or ``error``. For
+    pagination waits the mode is the wait label and the outcome is ``hit``
+    (the page changed) or ``timeout``. The mean covers every attempt; the
+    percentiles cover the last ``window`` of each mode.
+    """
+
+    def __init__(self, window: int = 10000):
+        self.outcomes = defaultdict(lambda: defaultdict(int))
+        self.total_seconds = defaultdict(float)
+        self.latencies = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, mode: str, outcome: str, seconds: float):
+        self.outcomes[mode][outcome] += 1
+        self.total_seconds[mode] += seconds
+        self.latencies[mode].append(seconds)
+
+    def summary(self) -> dict:
+        summary = {}
+        for mode, outcomes in self.outcomes.items():
+            attempts = sum(outcomes.values())
+            latencies = sorted(self.latencies[mode])
+            summary[mode] = {
+                'attempts': attempts,
+                'hit_rate': outcomes['hit'] / attempts if attempts else 0.0,
+                **dict(outcomes),
+                'mean_s': self.total_seconds[mode] / attempts if attempts else 0.0,
+                'p50_s': _percentile(latencies, 0.50),
+                'p95_s': _percentile(latencies, 0.95),
+            }
+        return summary
+
+    def report(self):
+        for mode, stats in self.summary().items():
+            print(f"[{mode}] attempts={stats['attempts']} hit_rate={stats['hit_rate']:.1%} "
+                  f"mean={stats['mean_s']:.2f}s p50={stats['p50_s']:.2f}s p95={stats['p95_s']:.2f}s")
+
+
+def _percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
@@ -0,0 +1,66 @@
+import re
+from datetime import datetime
+from typing import Optional
+
+NUMBER_RE = re.compile(r'\d[\d,]*(?:\.\d+)?')
+RANK_RE = re.compile(r'#\s*([\d,]+)')
+
+
+def parse_float(value) -> Optional[float]:
+    """First number in ``value`` ("$18.49", "4.6 out of 5 stars") as a float."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = NUMBER_RE.search(value)
+    return float(match.group().replace(',', '')) if match else None
+
+
+def parse_int(value) -> Optional[int]:
+    """First whole number in ``value`` ("2,417 ratings", "12 votes") as an int."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = NUMBER_RE.search(value)
+    return int(float(match.group().replace(',', ''))) if match else None
+
+
+def parse_helpful(value) -> Optional[int]:
+    """"12 people found this helpful" -> 12, "One person found this helpful" -> 1."""
+    if value is None:
+        return None
+    if value.strip().lower().startswith('one '):
+        return 1
+    return parse_int(value)
+
+
+def parse_rank(value) -> Optional[int]:
+    """"Best Sellers Rank:#1,024 in Beauty" -> 1024."""
+    if value is None:
+        return None
+    match = RANK_RE.search(value)
+    return int(match.group(1).replace(',', '')) if match else None
+
+
+REVIEW_META_RE = re.compile(r'Reviewed in (?:the )?(.+?) on (.+?)\s*$')
+REVIEW_DATE_FORMATS = ('%B %d, %Y', '%d %B %Y')
+
+
+def parse_review_meta(value) -> tuple:
+    """"Reviewed in the United States on March 1, 2024" -> ("United States", date(2024, 3, 1)).
+
+    Either part is None when it can't be read.
+    """
+    if not value:
+        return None, None
+    match = REVIEW_META_RE.search(value.strip())
+    if not match:
+        return None, None
+    country, date_text = match.groups()
+    for date_format in REVIEW_DATE_FORMATS:
+        try:
+            return country, datetime.strptime(date_text, date_format).date()
+        except ValueError:
+            pass
+    return country, None
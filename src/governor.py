@@ -0,0 +1,170 @@
+import asyncio
+import random
+import time
+from collections import defaultdict, deque
+from typing import Awaitable, Callable, Optional
+from urllib.parse import urlsplit
+
+import config
+from metrics import get_metrics
+
+OK = 'ok'
+BLOCKED = 'blocked'
+ERROR = 'error'
+
+# Responses that mean we are being throttled rather than that the page is broken
+BLOCK_STATUSES = (429, 503)
+
+
+class BlockedError(Exception):
+    """The site answered with a CAPTCHA / throttling page instead of content."""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, scale: float = 1.0):
+        """Take one token, waiting for it at ``rate * scale`` tokens per second."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                rate = self.rate * scale
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / rate)
+
+
+class RequestGovernor:
+    """Shared pacing and retry policy for every page request.
+
+    Each request takes a token from its host's bucket and, when it goes
+    through a proxy, from that proxy's bucket. All buckets run at
+    ``scale`` times their configured rate. The outcome of every request is
+    recorded; once at least ``min_samples`` of the last ``window`` requests
+    are in and ``trip_ratio`` of them were blocked (CAPTCHA, 429, 503), the
+    breaker opens: requests pause for ``cooldown`` seconds and ``scale`` is
+    halved. Each successful request afterwards adds ``recovery_step`` back
+    to ``scale``, up to 1.
+    """
+
+    def __init__(self,
+                 host_rate: float = config.GOVERNOR_HOST_RATE,
+                 host_burst: float = config.GOVERNOR_HOST_BURST,
+                 proxy_rate: float = config.GOVERNOR_PROXY_RATE,
+                 proxy_burst: float = config.GOVERNOR_PROXY_BURST,
+                 max_attempts: int = config.GOVERNOR_MAX_ATTEMPTS,
+                 base_delay: float = 1.0,
+                 max_delay: float = 60.0,
+                 window: int = 50,
+                 min_samples: int = 10,
+                 trip_ratio: float = config.GOVERNOR_TRIP_RATIO,
+                 cooldown: float = config.GOVERNOR_COOLDOWN,
+                 min_scale: float = 0.05,
+                 recovery_step: float = 0.02):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.trip_ratio = trip_ratio
+        self.cooldown = cooldown
+        self.min_scale = min_scale
+        self.recovery_step = recovery_step
+
+        self.host_buckets = defaultdict(lambda: TokenBucket(host_rate, host_burst))
+        self.proxy_buckets = defaultdict(lambda: TokenBucket(proxy_rate, proxy_burst))
+        self.recent = deque(maxlen=window)
+        self.scale = 1.0
+        self.open_until = 0.0
+        self.trips = 0
+        self.outcomes = defaultdict(lambda: defaultdict(int))
+
+    async def acquire(self, url: str, proxy: Optional[str] = None):
+        with get_metrics().timer('rate_limit_wait'):
+            delay = self.open_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.host_buckets[urlsplit(url).hostname].acquire(self.scale)
+        await self.acquire_proxy(proxy)
+
+    async def acquire_proxy(self, proxy: Optional[str]):
+        """The proxy's share of ``acquire``, for requests that only learn their proxy once under way."""
+        if proxy:
+            with get_metrics().timer('rate_limit_wait'):
+                await self.proxy_buckets[proxy].acquire(self.scale)
+
+    def record(self, url: str, outcome: str, proxy: Optional[str] = None):
+        host = urlsplit(url).hostname
+        self.outcomes[host][outcome] += 1
+        get_metrics().inc('scraper_requests_total', host=host, outcome=outcome)
+        if outcome == ERROR:
+            return
+        self.recent.append(outcome == BLOCKED)
+        if outcome == OK:
+            self.scale = min(1.0, self.scale + self.recovery_step)
+        elif (len(self.recent) >= self.min_samples and time.monotonic() >= self.open_until
+              and sum(self.recent) / len(self.recent) >= self.trip_ratio):
+            self.trips += 1
+            get_metrics().inc('scraper_breaker_trips_total')
+            self.scale = max(self.min_scale, self.scale / 2)
+            self.open_until = time.monotonic() + self.cooldown
+            self.recent.clear()
+            print(f"Block rate over {self.trip_ratio:.0%}, pausing {self.cooldown:g}s "
+                  f"and slowing to {self.scale:.0%} of the configured rate")
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter for the ``attempt``-th retry (0-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    @staticmethod
+    def classify(error: Exception) -> str:
+        if isinstance(error, BlockedError) or getattr(error, 'status', None) in BLOCK_STATUSES:
+            return BLOCKED
+        return ERROR
+
+    async def run(self, url: str, request: Callable[[], Awaitable],
+                  proxy: Optional[str] = None, max_attempts: Optional[int] = None):
+        """Await ``request()`` under the governor, retrying failures with backoff.
+
+        ``request`` should raise BlockedError (or an error with a 429/503
+        ``status``) when it gets a throttling page; the last error is re-raised
+        once ``max_attempts`` are used up.
+        """
+        attempts = max_attempts or self.max_attempts
+        for attempt in range(attempts):
+            await self.acquire(url, proxy)
+            try:
+                result = await request()
+            except Exception as e:
+                self.record(url, self.classify(e), proxy)
+                if attempt == attempts - 1:
+                    raise
+                print(f"{e} at {url}, retrying ({attempt + 1}/{attempts - 1})")
+                get_metrics().inc('scraper_retries_total', host=urlsplit(url).hostname)
+                await asyncio.sleep(self.backoff(attempt))
+                continue
+            self.record(url, OK, proxy)
+            return result
+
+    def report(self):
+        for host, outcomes in self.outcomes.items():
+            print(f"[{host}] {dict(outcomes)}")
+        print(f"[governor] scale={self.scale:.0%} breaker_trips={self.trips}")
+
+
+_governor = None
+
+
+def get_governor() -> RequestGovernor:
+    """The process-wide governor every scraper and HTTP client shares."""
+    global _governor
+    if _governor is None:
+        _governor = RequestGovernor()
+    return _governor
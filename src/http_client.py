@@ -0,0 +1,132 @@
+import asyncio
+import time
+from typing import Optional
+
+import aiohttp
+
+import config
+from governor import BLOCKED, OK, RequestGovernor, get_governor
+from metrics import get_metrics
+from proxy_pool import ProxyPool
+
+DEFAULT_HEADERS = {
+    'User-Agent': ('Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:123.0) '
+                   'Gecko/20100101 Firefox/123.0'),
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+}
+
+# Text that only shows up on Amazon's captcha / automated access pages
+BOT_CHECK_MARKERS = ('/errors/validateCaptcha',
+                     'Enter the characters you see below',
+                     'api-services-support@amazon.com')
+
+
+def looks_blocked(content: str) -> bool:
+    return any(marker in content for marker in BOT_CHECK_MARKERS)
+
+
+class HttpError(Exception):
+    def __init__(self, url: str, status: int):
+        super().__init__(f"HTTP {status} for {url}")
+        self.url = url
+        self.status = status
+
+
+class HttpClient:
+    """Keep-alive aiohttp session shared by every plain-HTTP fetch.
+
+    The underlying session and connection pool are created on first use and
+    live until ``close`` is called. With a ``proxy_pool`` each request goes
+    out through a proxy chosen from the pool instead of the single ``proxy``.
+    """
+
+    def __init__(self,
+                 pool_size: int = config.HTTP_POOL_SIZE,
+                 timeout: float = config.HTTP_TIMEOUT,
+                 proxy: Optional[str] = None,
+                 proxy_username: Optional[str] = None,
+                 proxy_password: Optional[str] = None,
+                 governor: Optional[RequestGovernor] = None,
+                 proxy_pool: Optional[ProxyPool] = None):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.proxy = proxy
+        self.proxy_auth = aiohttp.BasicAuth(proxy_username, proxy_password or '') if proxy_username else None
+        self.governor = governor or get_governor()
+        self.proxy_pool = proxy_pool
+        self._session = None
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def session(self) -> aiohttp.ClientSession:
+        async with self._lock:
+            if self._session is None or self._session.closed:
+                connector = aiohttp.TCPConnector(limit=self.pool_size,
+                                                 keepalive_timeout=60,
+                                                 ttl_dns_cache=300)
+                self._session = aiohttp.ClientSession(connector=connector,
+                                                      headers=DEFAULT_HEADERS,
+                                                      timeout=aiohttp.ClientTimeout(total=self.timeout))
+            return self._session
+
+    async def get_text(self, url: str) -> str:
+        """One paced GET; the outcome is reported to the governor, retrying is up to the caller."""
+        outcome = None
+        try:
+            await self.governor.acquire(url)
+            content = await self.fetch_text(url)
+            outcome = BLOCKED if looks_blocked(content) else OK
+            return content
+        except Exception as e:
+            outcome = self.governor.classify(e)
+            raise
+        finally:
+            if outcome is not None:
+                self.governor.record(url, outcome)
+
+    async def fetch_text(self, url: str) -> str:
+        """One GET paced by its proxy's bucket only, for use as a ``governor.run`` attempt.
+
+        The host bucket and the governor's outcome are left to the caller; a
+        pooled proxy still gets the outcome when it is handed back.
+        """
+        proxy, proxy_auth, pooled = self.proxy, self.proxy_auth, None
+        if self.proxy_pool is not None:
+            pooled = await self.proxy_pool.choose()
+            proxy = pooled.server
+            proxy_auth = aiohttp.BasicAuth(pooled.username, pooled.password or '') if pooled.username else None
+
+        outcome = None
+        start = time.perf_counter()
+        try:
+            # inside the try, so a pooled proxy is released if this is cancelled while waiting
+            await self.governor.acquire_proxy(proxy)
+            start = time.perf_counter()
+            with get_metrics().timer('http_fetch'):
+                content = await self._get_text(url, proxy, proxy_auth)
+            outcome = BLOCKED if looks_blocked(content) else OK
+            return content
+        except Exception as e:
+            outcome = self.governor.classify(e)
+            raise
+        finally:
+            if pooled is not None:
+                self.proxy_pool.release(pooled, outcome, time.perf_counter() - start)
+
+    async def _get_text(self, url: str, proxy: Optional[str], proxy_auth: Optional[aiohttp.BasicAuth]) -> str:
+        session = await self.session()
+        async with session.get(url, proxy=proxy, proxy_auth=proxy_auth) as response:
+            if response.status != 200:
+                raise HttpError(url, response.status)
+            return await response.text()
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
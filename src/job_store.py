@@ -0,0 +1,351 @@
+import argparse
+import csv
+import sqlite3
+import time
+from collections import defaultdict
+from itertools import islice
+from typing import Iterable, Optional
+
+import config
+from bloom import BloomFilter
+from metrics import get_metrics
+from urls import canonical_url, extract_asin
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+# a later URL for a product an earlier job already covers
+DUPLICATE = 'duplicate'
+
+# values of the old ``scraping`` column in dedup_urls.csv
+CSV_STATUS = {'0': PENDING, '1': DONE, '-1': FAILED}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER PRIMARY KEY,
+    url         TEXT NOT NULL UNIQUE,
+    asin        TEXT,
+    status      TEXT NOT NULL DEFAULT 'pending',
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    last_error  TEXT,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL,
+    started_at  REAL,
+    finished_at REAL,
+    output_path TEXT,
+    output_line INTEGER,
+    lease_owner TEXT,
+    lease_expires REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status);
+"""
+
+# columns added after the first release, for job stores created before them
+MIGRATIONS = {
+    'lease_owner': "ALTER TABLE jobs ADD COLUMN lease_owner TEXT",
+    'lease_expires': "ALTER TABLE jobs ADD COLUMN lease_expires REAL",
+    'asin': "ALTER TABLE jobs ADD COLUMN asin TEXT",
+}
+
+
+class JobStore:
+    """Per-URL scrape state in SQLite (WAL mode).
+
+    One row per URL with its status (pending / running / done / failed),
+    attempt count, last error, timestamps and where its record landed in the
+    output. Every state change is its own transaction, so a crash loses at
+    most the jobs that were in flight; those are put back to pending by
+    ``recover``. Pending work is read off the status index in id order, so
+    claiming a batch does not scan the table.
+
+    For several workers sharing the store, ``lease`` hands jobs out to an
+    owner until a deadline; leases that run out are put back to pending on
+    the next ``lease`` call, and ``mark_done`` / ``mark_failed`` with an
+    ``owner`` only apply while that owner still holds the lease.
+
+    URLs are stored canonical (see ``urls.canonical_url``) along with their
+    ASIN, and a URL for a product the store already has is not queued
+    again, unless that product was scraped longer than ``fresh_for``
+    seconds ago; then its job goes back to pending.
+    """
+
+    def __init__(self, path: str = config.JOB_DB_PATH, max_attempts: int = config.JOB_MAX_ATTEMPTS,
+                 fresh_for: float = config.FRESHNESS_WINDOW):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.fresh_for = fresh_for
+        # outcomes of add_urls: added, requeued, retried, duplicate, fresh
+        self.import_counts = defaultdict(int)
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        for column, statement in MIGRATIONS.items():
+            if column not in columns:
+                self.conn.execute(statement)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_asin ON jobs(asin)")
+        if 'asin' not in columns:
+            self._backfill_asins()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def _transaction(self):
+        return _Transaction(self.conn)
+
+    def add_urls(self, urls: Iterable, chunk_size: int = 10000) -> int:
+        """Queue ``url`` or ``(url, status)`` items, one job per product.
+
+        URLs are canonicalized first. Items for a product already in the
+        store, or earlier in ``urls``, are dropped, except that a product
+        whose job finished more than ``fresh_for`` seconds ago is queued
+        again, and a product whose jobs all failed is retried: under the new
+        URL when it differs, by requeueing the failed job otherwise. A product
+        is matched by ASIN and by URL, so a short link whose scrape found
+        its ASIN is recognised too. The store's URLs and ASINs are held in a
+        Bloom filter for the load, so only items it may have seen are looked
+        up in SQLite.
+
+        Returns:
+            int: number of jobs queued (new, requeued and retried)
+        """
+        now = time.time()
+        items = ((item, PENDING) if isinstance(item, str) else item for item in urls)
+        known = self._product_filter()
+        counts = defaultdict(int)
+        while True:
+            chunk = list(islice(items, chunk_size))
+            if not chunk:
+                break
+            rows, requeue, keys = [], [], set()
+            for url, status in chunk:
+                url = canonical_url(url)
+                asin = extract_asin(url)
+                key = asin or url
+                if key in keys:
+                    counts['duplicate'] += 1
+                    continue
+                keys.add(key)
+                if url in known or (asin is not None and asin in known):
+                    outcome, job_id = self._known_outcome(asin, url, status, now)
+                    if outcome is not None:
+                        counts[outcome] += 1
+                        if outcome in ('requeued', 'retried'):
+                            requeue.append((PENDING, now, job_id, PENDING, RUNNING))
+                        continue
+                known.add(url)
+                if asin is not None:
+                    known.add(asin)
+                rows.append((url, asin, status, now, now))
+            with self._transaction():
+                before = self.conn.total_changes
+                self.conn.executemany("INSERT OR IGNORE INTO jobs (url, asin, status, created_at, updated_at) "
+                                      "VALUES (?, ?, ?, ?, ?)", rows)
+                added = self.conn.total_changes - before
+                self.conn.executemany("UPDATE jobs SET status = ?, attempts = 0, last_error = NULL, updated_at = ? "
+                                      "WHERE id = ? AND status NOT IN (?, ?)", requeue)
+            counts['added'] += added
+            counts['duplicate'] += len(rows) - added
+
+        metrics = get_metrics()
+        for outcome, count in counts.items():
+            self.import_counts[outcome] += count
+            metrics.inc('scraper_urls_imported_total', count, outcome=outcome)
+        return counts['added'] + counts['requeued'] + counts['retried']
+
+    def _product_filter(self) -> BloomFilter:
+        """Every URL and ASIN in the store."""
+        total = self.conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+        known = BloomFilter(max(4 * total, config.URL_FILTER_CAPACITY))
+        for url, asin in self.conn.execute("SELECT url, asin FROM jobs"):
+            known.add(url)
+            if asin is not None:
+                known.add(asin)
+        return known
+
+    def _known_outcome(self, asin: Optional[str], url: str, status: str, now: float) -> tuple:
+        """What to do with a URL the filter has (probably) seen: (outcome, job id), or (None, None) if it is new."""
+        if asin is not None:
+            jobs = self.conn.execute("SELECT id, url, status, finished_at FROM jobs WHERE url = ? OR asin = ?",
+                                     (url, asin)).fetchall()
+        else:
+            jobs = self.conn.execute("SELECT id, url, status, finished_at FROM jobs WHERE url = ?", (url,)).fetchall()
+        if not jobs:
+            return None, None
+        same_url = next((job_id for job_id, job_url, _, _ in jobs if job_url == url), None)
+        if any(job_status in (PENDING, RUNNING) for _, _, job_status, _ in jobs) or status != PENDING:
+            return 'duplicate', same_url
+        done = [(finished_at or 0.0, job_id) for job_id, _, job_status, finished_at in jobs if job_status == DONE]
+        if done:
+            finished_at, job_id = max(done)
+            if self.fresh_for and finished_at and finished_at < now - self.fresh_for:
+                return 'requeued', job_id
+            return 'fresh', job_id
+        # every job for the product failed (or was a duplicate of one that did)
+        if same_url is not None:
+            return 'retried', same_url
+        return None, None
+
+    def _backfill_asins(self):
+        """ASINs for jobs from before the column existed; later jobs for an ASIN still pending become duplicates."""
+        rows = []
+        for job_id, url in self.conn.execute("SELECT id, url FROM jobs"):
+            asin = extract_asin(url)
+            if asin is not None:
+                rows.append((asin, job_id))
+        with self._transaction():
+            self.conn.executemany("UPDATE jobs SET asin = ? WHERE id = ?", rows)
+            self.conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND asin IS NOT NULL "
+                              "AND EXISTS (SELECT 1 FROM jobs AS earlier WHERE earlier.asin = jobs.asin "
+                              "AND earlier.id < jobs.id AND earlier.status != ?)",
+                              (DUPLICATE, time.time(), PENDING, FAILED))
+
+    def import_csv(self, csv_path: str, url_column: str = 'product URL') -> int:
+        """Load URLs from the dedup CSV, keeping any ``scraping`` marks (1 done, -1 failed)."""
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            rows = csv.DictReader(f)
+            return self.add_urls((row[url_column], CSV_STATUS.get(row.get('scraping') or '0', PENDING))
+                                 for row in rows)
+
+    def recover(self) -> int:
+        """Put jobs left running by a crashed run back to pending."""
+        with self._transaction():
+            return self.conn.execute("UPDATE jobs SET status = ?, updated_at = ?, lease_owner = NULL, "
+                                     "lease_expires = NULL WHERE status = ?",
+                                     (PENDING, time.time(), RUNNING)).rowcount
+
+    def claim(self, limit: int) -> list:
+        """Atomically move up to ``limit`` pending jobs to running.
+
+        Returns:
+            list: (job id, url) pairs
+        """
+        now = time.time()
+        with self._transaction():
+            jobs = self.conn.execute("SELECT id, url FROM jobs WHERE status = ? ORDER BY id LIMIT ?",
+                                     (PENDING, limit)).fetchall()
+            self.conn.executemany("UPDATE jobs SET status = ?, attempts = attempts + 1, "
+                                  "started_at = ?, updated_at = ? WHERE id = ?",
+                                  [(RUNNING, now, now, job_id) for job_id, _ in jobs])
+        return jobs
+
+    def lease(self, owner: str, limit: int, lease_seconds: float) -> list:
+        """Requeue expired leases, then lease up to ``limit`` pending jobs to ``owner``.
+
+        Returns:
+            list: (job id, url) pairs
+        """
+        now = time.time()
+        with self._transaction():
+            self._requeue_expired(now)
+            jobs = self.conn.execute("SELECT id, url FROM jobs WHERE status = ? ORDER BY id LIMIT ?",
+                                     (PENDING, limit)).fetchall()
+            self.conn.executemany("UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ?, "
+                                  "updated_at = ?, lease_owner = ?, lease_expires = ? WHERE id = ?",
+                                  [(RUNNING, now, now, owner, now + lease_seconds, job_id) for job_id, _ in jobs])
+        return jobs
+
+    def renew(self, owner: str, job_ids: list, lease_seconds: float) -> int:
+        """Extend ``owner``'s leases on ``job_ids``; returns how many it still holds."""
+        now = time.time()
+        with self._transaction():
+            return sum(self.conn.execute("UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                                         "WHERE id = ? AND status = ? AND lease_owner = ?",
+                                         (now + lease_seconds, now, job_id, RUNNING, owner)).rowcount
+                       for job_id in job_ids)
+
+    def owns(self, job_id: int, owner: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM jobs WHERE id = ? AND status = ? AND lease_owner = ?",
+                                 (job_id, RUNNING, owner)).fetchone() is not None
+
+    def requeue_expired(self) -> int:
+        with self._transaction():
+            return self._requeue_expired(time.time())
+
+    def _requeue_expired(self, now: float) -> int:
+        return self.conn.execute("UPDATE jobs SET status = ?, lease_owner = NULL, lease_expires = NULL, "
+                                 "updated_at = ? WHERE status = ? AND lease_expires < ?",
+                                 (PENDING, now, RUNNING, now)).rowcount
+
+    def mark_done(self, job_id: int, output_path: Optional[str] = None, output_line: Optional[int] = None,
+                  owner: Optional[str] = None, asin: Optional[str] = None) -> bool:
+        """``asin`` is the one the scrape found, for URLs that did not carry it."""
+        now = time.time()
+        with self._transaction():
+            return self.conn.execute("UPDATE jobs SET status = ?, last_error = NULL, finished_at = ?, updated_at = ?, "
+                                     "output_path = ?, output_line = ?, lease_owner = NULL, lease_expires = NULL, "
+                                     "asin = COALESCE(asin, ?) "
+                                     "WHERE id = ? AND (? IS NULL OR lease_owner = ?)",
+                                     (DONE, now, now, output_path, output_line, asin,
+                                      job_id, owner, owner)).rowcount > 0
+
+    def mark_failed(self, job_id: int, error: str, owner: Optional[str] = None) -> bool:
+        """Record the error; the job goes back to pending until it has used ``max_attempts``."""
+        now = time.time()
+        with self._transaction():
+            return self.conn.execute("UPDATE jobs SET status = CASE WHEN attempts < ? THEN ? ELSE ? END, "
+                                     "last_error = ?, finished_at = ?, updated_at = ?, "
+                                     "lease_owner = NULL, lease_expires = NULL "
+                                     "WHERE id = ? AND (? IS NULL OR lease_owner = ?)",
+                                     (self.max_attempts, PENDING, FAILED, error, now, now,
+                                      job_id, owner, owner)).rowcount > 0
+
+    def counts(self) -> dict:
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def export_csv(self, csv_path: str):
+        """Write url / status / attempts / last_error / output location for every job."""
+        cursor = self.conn.execute("SELECT url, status, attempts, last_error, output_path, output_line "
+                                   "FROM jobs ORDER BY id")
+        with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow([column[0] for column in cursor.description])
+            writer.writerows(cursor)
+
+
+class _Transaction:
+    """``BEGIN IMMEDIATE`` ... ``COMMIT`` (``ROLLBACK`` on error) on an autocommit connection."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the scrape job store")
+    parser.add_argument('--db', default=config.JOB_DB_PATH)
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_cmd = commands.add_parser('import', help="add URLs from a CSV")
+    import_cmd.add_argument('csv', nargs='?', default=config.URLS_CSV)
+    commands.add_parser('status', help="job counts per status")
+    commands.add_parser('recover', help="requeue jobs left running by a crash")
+    export_cmd = commands.add_parser('export', help="write job state to a CSV")
+    export_cmd.add_argument('csv')
+    args = parser.parse_args()
+
+    with JobStore(args.db) as store:
+        if args.command == 'import':
+            print(f"added {store.import_csv(args.csv)} jobs {dict(store.import_counts)}")
+        elif args.command == 'recover':
+            print(f"requeued {store.recover()} jobs")
+        elif args.command == 'export':
+            store.export_csv(args.csv)
+        print(store.counts())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+import asyncio
+import json
+import os
+import resource
+import time
+from bisect import bisect_left
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from aiohttp import web
+
+import config
+
+# Upper bounds in seconds; a stage takes anything from a field lookup to a full review crawl
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_current_trace = ContextVar('current_trace', default=None)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket the ``q`` quantile falls in."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Trace:
+    """Timeline of one product: every timed stage that ran on its behalf."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.spans = []
+        self.error = None
+        self.seconds = None
+
+    def add(self, stage: str, start: float, seconds: float, labels: dict):
+        self.spans.append({'stage': stage, 'offset_s': round(start - self._start, 6),
+                           'seconds': round(seconds, 6), **labels})
+
+    def to_dict(self) -> dict:
+        return {'url': self.url, 'started': self.started, 'seconds': self.seconds,
+                'error': self.error, 'spans': self.spans}
+
+
+class Metrics:
+    """Counters, latency histograms and per-product traces for the whole pipeline.
+
+    Stages are timed with ``with metrics.timer('navigation'):``; each timing
+    goes into the ``scraper_stage_seconds`` histogram under its stage label
+    and, when it runs inside ``with metrics.trace(url):``, into that
+    product's trace as well. The last ``keep_traces`` finished traces are
+    kept in memory and, with ``trace_path``, appended to a JSONL file.
+    Gauges are callables sampled when the metrics are rendered.
+    """
+
+    def __init__(self, keep_traces: int = 100, trace_path: Optional[str] = config.METRICS_TRACE_PATH):
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.gauges = {}
+        self.help = {}
+        self.traces = deque(maxlen=keep_traces)
+        self.trace_path = trace_path
+        self.started = time.time()
+        self.describe('scraper_stage_seconds', "Seconds spent per pipeline stage (and extraction step)")
+        self.describe('scraper_product_seconds', "Seconds per product scrape, from queue to record")
+        self.describe('scraper_products_total', "Products scraped, by outcome")
+        self.describe('scraper_requests_total', "Page requests seen by the governor, by host and outcome")
+        self.describe('scraper_retries_total', "Page requests retried by the governor")
+        self.describe('scraper_urls_imported_total', "URLs offered to the job store, by outcome")
+        self.gauge('scraper_process_max_rss_bytes', _max_rss_bytes, "Peak resident set size of this process")
+        self.gauge('scraper_process_cpu_seconds', _cpu_seconds, "User plus system CPU time of this process")
+
+    def describe(self, name: str, text: str):
+        self.help[name] = text
+
+    def inc(self, name: str, value: float = 1, **labels):
+        self.counters[name, _label_key(labels)] += value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, _label_key(labels))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+    def gauge(self, name: str, sample: Callable[[], float], text: Optional[str] = None):
+        self.gauges[name] = sample
+        if text:
+            self.describe(name, text)
+
+    def record_stage(self, stage: str, start: float, seconds: float, **labels):
+        self.observe('scraper_stage_seconds', seconds, stage=stage, **labels)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(stage, start, seconds, labels)
+
+    @contextmanager
+    def timer(self, stage: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.record_stage(stage, start, time.perf_counter() - start, outcome='error', **labels)
+            raise
+        self.record_stage(stage, start, time.perf_counter() - start, **labels)
+
+    def record_timings(self, stage: str, timings: dict):
+        """Timings measured elsewhere (e.g. in an extraction worker), as ``{label: seconds}``."""
+        now = time.perf_counter()
+        for label, seconds in timings.items():
+            self.record_stage(stage, now - seconds, seconds, step=label)
+
+    @contextmanager
+    def trace(self, url: str):
+        trace = Trace(url)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        except BaseException as e:
+            trace.error = repr(e)
+            raise
+        finally:
+            _current_trace.reset(token)
+            trace.seconds = time.perf_counter() - trace._start
+            self.traces.append(trace)
+            if self.trace_path:
+                with open(self.trace_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(trace.to_dict(), ensure_ascii=False) + '\n')
+
+    def render(self) -> str:
+        """Everything in the Prometheus text exposition format."""
+        lines = []
+        typed = set()
+
+        def header(name: str, kind: str):
+            if name in typed:
+                return
+            typed.add(name)
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for (name, key), value in sorted(self.counters.items()):
+            header(name, 'counter')
+            lines.append(f"{name}{_format_labels(key)} {float(value)!r}")
+        for (name, key), histogram in sorted(self.histograms.items()):
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(key, (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum!r}")
+            lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        for name, sample in sorted(self.gauges.items()):
+            header(name, 'gauge')
+            lines.append(f"{name} {float(sample())!r}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> dict:
+        """Everything as plain JSON-able data, with mean / p50 / p95 per histogram."""
+        def labelled(name: str, key: tuple) -> str:
+            return name + _format_labels(key)
+
+        return {
+            'time': time.time(),
+            'uptime_s': time.time() - self.started,
+            'counters': {labelled(name, key): value for (name, key), value in sorted(self.counters.items())},
+            'histograms': {
+                labelled(name, key): {
+                    'count': histogram.count,
+                    'sum_s': histogram.sum,
+                    'mean_s': histogram.sum / histogram.count if histogram.count else 0.0,
+                    'p50_s': histogram.quantile(0.50),
+                    'p95_s': histogram.quantile(0.95),
+                } for (name, key), histogram in sorted(self.histograms.items())
+            },
+            'gauges': {name: sample() for name, sample in sorted(self.gauges.items())},
+        }
+
+    def dump(self, path: str):
+        """Write ``snapshot()`` to ``path``, replacing it atomically."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    async def dump_every(self, path: str, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self.dump(path)
+
+    def routes(self) -> list:
+        async def prometheus(request):
+            return web.Response(text=self.render(), content_type='text/plain', charset='utf-8',
+                                headers={'X-Prometheus-Format': '0.0.4'})
+
+        async def as_json(request):
+            return web.json_response(self.snapshot())
+
+        async def traces(request):
+            return web.json_response([trace.to_dict() for trace in self.traces])
+
+        return [web.get('/metrics', prometheus), web.get('/metrics.json', as_json), web.get('/traces', traces)]
+
+    async def serve(self, host: str = config.METRICS_HOST, port: int = config.METRICS_PORT) -> web.AppRunner:
+        """Serve ``/metrics``, ``/metrics.json`` and ``/traces``; clean up the returned runner to stop."""
+        app = web.Application()
+        app.add_routes(self.routes())
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        print(f"Serving metrics on http://{host}:{port}/metrics")
+        return runner
+
+
+def _max_rss_bytes() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+_metrics = None
+
+
+def get_metrics() -> Metrics:
+    """The process-wide metrics every stage records into."""
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
@@ -0,0 +1,257 @@
+import glob
+import gzip
+import io
+import json
+import os
+import re
+from typing import Callable, Iterable, Iterator, Optional, Union
+
+import config
+from metrics import get_metrics
+from records import to_json
+
+EXTENSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+# Child streams (see ChildStreams) and the ID field of their lines
+REVIEW_STREAM = 'review'
+QA_STREAM = 'qa'
+ID_FIELDS = {REVIEW_STREAM: 'review_id', QA_STREAM: 'question_id'}
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstd compression needs the zstandard package (pip install zstandard)")
+    return zstandard
+
+
+class JsonlSink:
+    """Append-only JSON Lines writer for scraped records.
+
+    Records are buffered and written one per line to
+    ``<directory>/<prefix>-NNNNN.jsonl[.gz|.zst]``. The file is flushed and
+    fsynced every ``fsync_every`` records and a new file is started once the
+    current one holds ``max_bytes`` of (uncompressed) JSON. Numbering continues
+    after any files already in ``directory``, so existing output is never
+    rewritten. Work that must wait until a record is durable (marking its
+    job done) is handed to ``when_synced`` and runs at the next fsync.
+    """
+
+    def __init__(self,
+                 directory: str = config.OUTPUT_DIR,
+                 prefix: str = config.OUTPUT_PREFIX,
+                 compression: Optional[str] = config.OUTPUT_COMPRESSION,
+                 max_bytes: int = config.OUTPUT_MAX_BYTES,
+                 fsync_every: int = config.OUTPUT_FSYNC_EVERY,
+                 buffer_size: int = 1 << 20):
+        if compression not in EXTENSIONS:
+            raise ValueError(f"Unknown compression {compression!r}, expected one of {list(EXTENSIONS)}")
+        self.directory = directory
+        self.prefix = prefix
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self.fsync_every = fsync_every
+        self.buffer_size = buffer_size
+
+        os.makedirs(directory, exist_ok=True)
+        self.index = self._last_index()
+        self.path = None
+        self._raw = None
+        self._stream = None
+        self._bytes = 0
+        self._lines = 0
+        self._pending = 0
+        self._on_sync = []
+        self.records_written = 0
+
+    def _last_index(self) -> int:
+        pattern = re.compile(rf'^{re.escape(self.prefix)}-(\d+)\.jsonl')
+        indexes = [int(m.group(1)) for m in map(pattern.match, os.listdir(self.directory)) if m]
+        return max(indexes, default=0)
+
+    def _open_next(self):
+        self.close()
+        self.index += 1
+        self.path = os.path.join(self.directory,
+                                 f"{self.prefix}-{self.index:05d}.jsonl{EXTENSIONS[self.compression]}")
+        if self.compression is None:
+            self._raw = open(self.path, 'xb', buffering=self.buffer_size)
+            self._stream = self._raw
+        else:
+            self._raw = open(self.path, 'xb')
+            if self.compression == 'gzip':
+                compressor = gzip.GzipFile(fileobj=self._raw, mode='wb')
+            else:
+                compressor = _zstd().ZstdCompressor().stream_writer(self._raw)
+            self._stream = io.BufferedWriter(compressor, buffer_size=self.buffer_size)
+        self._bytes = 0
+        self._lines = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, record: dict) -> tuple:
+        """Write one record.
+
+        Returns:
+            tuple: (path, line number) the record was written to
+        """
+        metrics = get_metrics()
+        with metrics.timer('serialize'):
+            line = (json.dumps(record, ensure_ascii=False, default=to_json) + '\n').encode('utf-8')
+        with metrics.timer('output_write'):
+            if self._stream is None or (self._bytes and self._bytes + len(line) > self.max_bytes):
+                self._open_next()
+            self._stream.write(line)
+        metrics.inc('scraper_output_bytes_total', len(line))
+        self._bytes += len(line)
+        self._lines += 1
+        self._pending += 1
+        self.records_written += 1
+        if self._pending >= self.fsync_every:
+            self.sync()
+        return self.path, self._lines
+
+    def when_synced(self, callback: Callable[[], None]):
+        """Run ``callback`` once everything written so far is on disk (at the next ``sync``)."""
+        self._on_sync.append(callback)
+        if self._stream is None:
+            self._run_synced()
+
+    def _run_synced(self):
+        callbacks, self._on_sync = self._on_sync, []
+        for callback in callbacks:
+            callback()
+
+    def sync(self):
+        if self._stream is None:
+            return
+        with get_metrics().timer('output_sync'):
+            self._stream.flush()
+            if self.compression == 'gzip':
+                self._stream.raw.flush(gzip.zlib.Z_SYNC_FLUSH)
+            elif self.compression == 'zstd':
+                self._stream.raw.flush(_zstd().FLUSH_BLOCK)
+            self._raw.flush()
+            os.fsync(self._raw.fileno())
+        self._pending = 0
+        self._run_synced()
+
+    def close(self):
+        if self._stream is None:
+            return
+        self.sync()
+        if self._stream is not self._raw:
+            self._stream.close()  # writes the gzip/zstd trailer
+        if not self._raw.closed:
+            self._raw.close()
+        self._stream = None
+        self._raw = None
+
+
+def child_prefix(stream: str, prefix: str = config.OUTPUT_PREFIX) -> str:
+    """File prefix of a child stream, for ``iter_records(prefix=...)``."""
+    return f"{prefix}-{stream}"
+
+
+class ChildStreams:
+    """Reviews and Q&A appended page by page to their own JSONL streams while a product is scraped.
+
+    Every line is one review or question tagged with its product's ``ASIN``
+    and ``scrape_id``; the product record only carries the counts and the
+    ``scrape_id`` to join on, so a product's memory use does not grow with its
+    review count. The IDs written for a scrape are kept until ``finish`` (for
+    the seen-ID store). Lines whose ``scrape_id`` never shows up in a product
+    record belong to a scrape that failed later and can be skipped.
+    """
+
+    def __init__(self,
+                 directory: str = config.OUTPUT_DIR,
+                 prefix: str = config.OUTPUT_PREFIX,
+                 on_batch: Optional[Callable[[str, str, str, list], None]] = None):
+        self.sinks = {stream: JsonlSink(directory, child_prefix(stream, prefix)) for stream in ID_FIELDS}
+        # called with (stream, asin, scrape_id, batch) after each batch is written, e.g. ParquetExporter.add_batch
+        self.on_batch = on_batch
+        self._ids = {}  # scrape_id -> stream -> IDs written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, stream: str, asin: str, scrape_id: str, batch: list):
+        sink = self.sinks[stream]
+        ids = self._ids.setdefault(scrape_id, {}).setdefault(stream, [])
+        for item in batch:
+            row = item.to_dict()
+            sink.write({'ASIN': asin, 'scrape_id': scrape_id, **row})
+            ids.append(row[ID_FIELDS[stream]])
+        if self.on_batch is not None:
+            self.on_batch(stream, asin, scrape_id, batch)
+
+    def finish(self, scrape_id: str) -> dict:
+        """Sync the streams and hand back ``{stream: IDs}`` written for a scrape whose record is out."""
+        self.sync()
+        return self._ids.pop(scrape_id, {})
+
+    def discard(self, scrape_id: str):
+        self._ids.pop(scrape_id, None)
+
+    def sync(self):
+        for sink in self.sinks.values():
+            sink.sync()
+
+    def close(self):
+        for sink in self.sinks.values():
+            sink.close()
+
+
+def _open_text(path: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.zst'):
+        return io.TextIOWrapper(_zstd().ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True),
+                                encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def output_files(source: Union[str, Iterable[str]] = config.OUTPUT_DIR,
+                 prefix: str = config.OUTPUT_PREFIX) -> list:
+    """The sink's files in write order; ``source`` is a directory, a glob, a file or a list of files."""
+    if not isinstance(source, str):
+        return list(source)
+    if os.path.isdir(source):
+        # only <prefix>-NNNNN files, not the <prefix>-<stream>-NNNNN child streams
+        pattern = re.compile(rf'^{re.escape(prefix)}-\d+\.jsonl')
+        return sorted(path for path in glob.glob(os.path.join(source, f"{prefix}-*.jsonl*"))
+                      if pattern.match(os.path.basename(path)))
+    if any(c in source for c in '*?['):
+        return sorted(glob.glob(source))
+    return [source]
+
+
+def iter_records(source: Union[str, Iterable[str]] = config.OUTPUT_DIR,
+                 prefix: str = config.OUTPUT_PREFIX) -> Iterator[dict]:
+    """Stream records back out of JSON Lines output, one file and one line at a time.
+
+    Also reads the old single-array ``outputs.json`` produced by
+    ``correct_json_file`` (that one is loaded whole).
+    """
+    for path in output_files(source, prefix):
+        with _open_text(path) as f:
+            first = f.read(1)
+            while first.isspace():
+                first = f.read(1)
+            if first == '[':
+                yield from json.loads(first + f.read())
+                continue
+            for line_no, line in enumerate(f, 1):
+                if line_no == 1:
+                    line = first + line
+                if line.strip():
+                    yield json.loads(line)
@@ -0,0 +1,85 @@
+import time
+from typing import Optional
+
+from playwright.async_api import Error as PlaywrightError
+from playwright.async_api import TimeoutError
+
+import config
+from fetch_stats import FetchStats
+from governor import BLOCK_STATUSES, BlockedError
+from http_client import looks_blocked
+from metrics import get_metrics
+
+ITEM_IDS_JS = "elements => elements.map(el => el.id)"
+
+# True once the page has navigated away or an item with an unseen id is present
+PAGE_CHANGED_JS = """({selector, ids, url}) => {
+    if (location.href !== url) return true;
+    const seen = new Set(ids);
+    for (const el of document.querySelectorAll(selector)) {
+        if (el.id && !seen.has(el.id)) return true;
+    }
+    return false;
+}"""
+
+
+async def goto_checked(page, url: str, timeout: int, check_content: bool = False):
+    """``page.goto`` that raises BlockedError on a 429/503 or (optionally) a CAPTCHA page."""
+    with get_metrics().timer('navigation'):
+        response = await page.goto(url, timeout=timeout)
+    if response is not None and response.status in BLOCK_STATUSES:
+        raise BlockedError(f"HTTP {response.status} for {url}")
+    if check_content:
+        content = await page.content()
+        if looks_blocked(content):
+            raise BlockedError(f"Bot check page for {url}")
+        return content
+    return None
+
+
+async def click_and_wait(page, button, item_selector: str,
+                         label: str = 'navigation',
+                         stats: Optional[FetchStats] = None,
+                         timeout: int = config.PAGINATION_WAIT_TIMEOUT_MS,
+                         fallback_timeout: int = config.PAGINATION_FALLBACK_TIMEOUT_MS) -> float:
+    """Click ``button`` and wait until the page actually changes.
+
+    The page counts as changed when its URL changes or an element matching
+    ``item_selector`` with an id that was not there before the click appears.
+    If neither happens within ``timeout`` ms, waits up to ``fallback_timeout``
+    ms for the network to go idle instead. The wait is recorded in ``stats``
+    under ``label`` as a ``hit`` or a ``timeout``.
+
+    Returns:
+        float: seconds spent waiting after the click
+    """
+    before_ids = await page.eval_on_selector_all(item_selector, ITEM_IDS_JS)
+    before_url = page.url
+    await button.click()
+
+    start = time.perf_counter()
+    outcome = 'hit'
+    try:
+        await page.wait_for_function(PAGE_CHANGED_JS,
+                                     arg={'selector': item_selector, 'ids': before_ids, 'url': before_url},
+                                     timeout=timeout)
+    except TimeoutError:
+        outcome = 'timeout'
+        try:
+            await page.wait_for_load_state('networkidle', timeout=fallback_timeout)
+        except TimeoutError:
+            pass
+    except PlaywrightError:
+        # the execution context is destroyed when the click navigates
+        pass
+
+    try:
+        await page.wait_for_load_state('domcontentloaded', timeout=fallback_timeout)
+    except TimeoutError:
+        pass
+
+    elapsed = time.perf_counter() - start
+    get_metrics().record_stage('pagination_wait', start, elapsed, label=label, outcome=outcome)
+    if stats is not None:
+        stats.record(label, outcome, elapsed)
+    return elapsed
@@ -0,0 +1,268 @@
+import argparse
+import os
+import re
+from typing import Iterable, Optional
+
+import config
+from field_parsers import parse_float, parse_int, parse_rank
+from output_sink import QA_STREAM, REVIEW_STREAM, child_prefix, iter_records
+from records import Question, Review
+
+# Product keys with their own column; every other top-level string goes into ``details``
+PRODUCT_KEYS = {'product_name', 'about_items', 'price', 'amazon choice', 'ASIN', 'avg_rating',
+                'num_ratings', 'overall rank', 'subranks', 'Climate Pledge Badges',
+                'Number of Badges', 'AI Sentiments', 'AI Summary', 'Needs Reviews',
+                'fully_scraped', 'Reviews', 'QA', 'scrape_id', 'review_count', 'qa_count',
+                'incremental'}
+
+TABLES = ('products', 'reviews', 'qa', 'climate_badges')
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet export needs the pyarrow package (pip install pyarrow)")
+    return pyarrow
+
+
+def schemas() -> dict:
+    pa = _pyarrow()
+    return {
+        'products': pa.schema([
+            ('asin', pa.string()),
+            ('product_name', pa.string()),
+            ('about_items', pa.list_(pa.string())),
+            ('total_price', pa.float64()),
+            ('total_price_text', pa.string()),
+            ('unit_price_text', pa.string()),
+            ('amazon_choice', pa.bool_()),
+            ('avg_rating', pa.float64()),
+            ('num_ratings', pa.int64()),
+            ('overall_rank', pa.int64()),
+            ('overall_rank_text', pa.string()),
+            ('subranks', pa.list_(pa.string())),
+            ('number_of_badges', pa.int32()),
+            ('ai_summary', pa.string()),
+            ('ai_sentiments', pa.map_(pa.string(), pa.string())),
+            ('needs_reviews', pa.bool_()),
+            ('fully_scraped', pa.bool_()),
+            ('review_count', pa.int32()),
+            ('qa_count', pa.int32()),
+            ('scrape_id', pa.string()),
+            ('details', pa.map_(pa.string(), pa.string())),
+        ]),
+        'reviews': pa.schema([
+            ('asin', pa.string()),
+            ('scrape_id', pa.string()),
+            ('review_id', pa.string()),
+            ('title', pa.string()),
+            ('text', pa.string()),
+            ('rating', pa.float64()),
+            ('helpful', pa.int32()),
+            ('meta', pa.string()),
+            ('country', pa.string()),
+            ('date', pa.date32()),
+        ]),
+        'qa': pa.schema([
+            ('asin', pa.string()),
+            ('scrape_id', pa.string()),
+            ('question_id', pa.string()),
+            ('question', pa.string()),
+            ('answer', pa.string()),
+            ('votes', pa.int32()),
+            ('all_answers', pa.list_(pa.string())),
+        ]),
+        'climate_badges': pa.schema([
+            ('asin', pa.string()),
+            ('feature', pa.string()),
+            ('certification', pa.string()),
+            ('level', pa.string()),
+        ]),
+    }
+
+
+def _map(values: Optional[dict]) -> Optional[list]:
+    return list(values.items()) if values else None
+
+
+def _strip(value: Optional[str]) -> Optional[str]:
+    return value.strip() if isinstance(value, str) else value
+
+
+def product_row(record: dict) -> dict:
+    price = record.get('price') or {}
+    details = {key: value for key, value in record.items()
+               if key not in PRODUCT_KEYS and isinstance(value, str)}
+    return {
+        'asin': record.get('ASIN'),
+        'product_name': record.get('product_name'),
+        'about_items': record.get('about_items'),
+        'total_price': parse_float(price.get('total price')),
+        'total_price_text': price.get('total price'),
+        'unit_price_text': price.get('unit price'),
+        'amazon_choice': record.get('amazon choice'),
+        'avg_rating': parse_float(record.get('avg_rating')),
+        'num_ratings': parse_int(record.get('num_ratings')),
+        'overall_rank': parse_rank(record.get('overall rank')),
+        'overall_rank_text': record.get('overall rank'),
+        'subranks': [_strip(s) for s in record['subranks']] if record.get('subranks') else None,
+        'number_of_badges': record.get('Number of Badges'),
+        'ai_summary': record.get('AI Summary'),
+        'ai_sentiments': _map(record.get('AI Sentiments')),
+        'needs_reviews': record.get('Needs Reviews'),
+        'fully_scraped': record.get('fully_scraped'),
+        'review_count': record.get('review_count', len(record['Reviews']) if 'Reviews' in record else None),
+        'qa_count': record.get('qa_count', len(record['QA']) if 'QA' in record else None),
+        'scrape_id': record.get('scrape_id'),
+        'details': _map(details),
+    }
+
+
+def review_rows(asin: str, reviews: Iterable, scrape_id: Optional[str] = None) -> list:
+    rows = []
+    for review in map(Review.from_dict, reviews):
+        rows.append({'asin': asin, 'scrape_id': scrape_id, **review.to_dict(), 'date': review.date})
+    return rows
+
+
+def qa_rows(asin: str, qa: Iterable, scrape_id: Optional[str] = None) -> list:
+    return [{
+        'asin': asin,
+        'scrape_id': scrape_id,
+        'question_id': item.question_id,
+        'question': _strip(item.question),
+        'answer': _strip(item.answer),
+        'votes': item.votes,
+        'all_answers': item.all_answers,
+    } for item in map(Question.from_dict, qa)]
+
+
+def badge_rows(asin: str, badges: Optional[dict]) -> list:
+    rows = []
+    for feature, values in (badges or {}).items():
+        rows.append({
+            'asin': asin,
+            'feature': _strip(feature),
+            'certification': _strip(values[0]) if values else None,
+            'level': _strip(values[1]) if len(values) > 1 else None,
+        })
+    return rows
+
+
+class ParquetExporter:
+    """Splits scraped records into typed products / reviews / qa / climate_badges tables.
+
+    Rows are buffered per table and written as a row group every
+    ``row_group_rows`` rows to ``<directory>/<table>/part-NNNNN.parquet``, so
+    each table directory reads back as one dataset. Numbering continues after
+    any parts already there.
+
+    Reviews and Q&A carry the ``scrape_id`` of the scrape they came from;
+    streamed ones (``add_batch``) are written before their product, and rows
+    whose ``scrape_id`` never appears in the products table belong to a
+    scrape that failed or was retried.
+    """
+
+    def __init__(self,
+                 directory: str = config.PARQUET_DIR,
+                 row_group_rows: int = config.PARQUET_ROW_GROUP_ROWS,
+                 compression: str = config.PARQUET_COMPRESSION):
+        self.pa = _pyarrow()
+        self.directory = directory
+        self.row_group_rows = row_group_rows
+        self.compression = compression
+        self.schemas = schemas()
+        self.rows = {table: [] for table in TABLES}
+        self.writers = {}
+        self.paths = {}
+        self.rows_written = {table: 0 for table in TABLES}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add(self, record: dict):
+        asin = record.get('ASIN')
+        scrape_id = record.get('scrape_id')
+        self._extend('products', [product_row(record)])
+        self._extend('reviews', review_rows(asin, record.get('Reviews') or [], scrape_id))
+        self._extend('qa', qa_rows(asin, record.get('QA') or [], scrape_id))
+        self._extend('climate_badges', badge_rows(asin, record.get('Climate Pledge Badges')))
+
+    def add_batch(self, stream: str, asin: str, scrape_id: str, batch: list):
+        """A batch of streamed reviews or Q&A (see output_sink.ChildStreams)."""
+        if stream == REVIEW_STREAM:
+            self._extend('reviews', review_rows(asin, batch, scrape_id))
+        elif stream == QA_STREAM:
+            self._extend('qa', qa_rows(asin, batch, scrape_id))
+
+    def _extend(self, table: str, rows: list):
+        self.rows[table].extend(rows)
+        if len(self.rows[table]) >= self.row_group_rows:
+            self.flush(table)
+
+    def _writer(self, table: str):
+        if table not in self.writers:
+            table_dir = os.path.join(self.directory, table)
+            os.makedirs(table_dir, exist_ok=True)
+            pattern = re.compile(r'^part-(\d+)\.parquet$')
+            index = max((int(m.group(1)) for m in map(pattern.match, os.listdir(table_dir)) if m), default=0)
+            self.paths[table] = os.path.join(table_dir, f"part-{index + 1:05d}.parquet")
+            self.writers[table] = self.pa.parquet.ParquetWriter(self.paths[table], self.schemas[table],
+                                                                compression=self.compression)
+        return self.writers[table]
+
+    def flush(self, table: Optional[str] = None):
+        for name in (table,) if table else TABLES:
+            rows = self.rows[name]
+            if not rows:
+                continue
+            batch = self.pa.Table.from_pylist(rows, schema=self.schemas[name])
+            self._writer(name).write_table(batch, row_group_size=len(rows))
+            self.rows_written[name] += len(rows)
+            self.rows[name] = []
+
+    def close(self):
+        self.flush()
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+
+def export(source=config.OUTPUT_DIR, directory: str = config.PARQUET_DIR,
+           prefix: str = config.OUTPUT_PREFIX, row_group_rows: int = config.PARQUET_ROW_GROUP_ROWS) -> dict:
+    """Convert existing JSON Lines output to Parquet tables. Returns rows written per table.
+
+    When ``source`` is a directory the review and Q&A child streams in it
+    are read as well.
+    """
+    with ParquetExporter(directory, row_group_rows) as exporter:
+        for record in iter_records(source, prefix):
+            exporter.add(record)
+        if isinstance(source, str) and os.path.isdir(source):
+            for stream in (REVIEW_STREAM, QA_STREAM):
+                for item in iter_records(source, child_prefix(stream, prefix)):
+                    exporter.add_batch(stream, item.get('ASIN'), item.get('scrape_id'), [item])
+    return exporter.rows_written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export scraped JSON Lines output to Parquet tables")
+    parser.add_argument('source', nargs='?', default=config.OUTPUT_DIR,
+                        help="output directory, glob or file (default: %(default)s)")
+    parser.add_argument('--out', default=config.PARQUET_DIR or os.path.join(config.OUTPUT_DIR, 'parquet'),
+                        help="directory for the table datasets (default: %(default)s)")
+    parser.add_argument('--prefix', default=config.OUTPUT_PREFIX)
+    parser.add_argument('--row-group-rows', type=int, default=config.PARQUET_ROW_GROUP_ROWS)
+    args = parser.parse_args()
+
+    for table, rows in export(args.source, args.out, args.prefix, args.row_group_rows).items():
+        print(f"{table}: {rows} rows")
+
+
+if __name__ == "__main__":
+    main()
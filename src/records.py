@@ -0,0 +1,129 @@
+from datetime import date
+from typing import Optional
+
+from field_parsers import parse_float, parse_helpful, parse_int, parse_review_meta
+
+
+class Review:
+    """One review, with its rating, helpful count, date and country parsed once when scraped.
+
+    ``to_dict`` is the form written to JSON Lines; ``from_dict`` reads it back,
+    as well as the older all-strings form (``ratings``, "12 people found this
+    helpful").
+    """
+
+    __slots__ = ('review_id', 'title', 'text', 'rating', 'helpful', 'meta', 'country', 'date')
+
+    def __init__(self, review_id: str,
+                 title: Optional[str] = None,
+                 text: Optional[str] = None,
+                 rating: Optional[float] = None,
+                 helpful: Optional[int] = None,
+                 meta: Optional[str] = None,
+                 country: Optional[str] = None,
+                 date: Optional[date] = None):
+        self.review_id = review_id
+        self.title = title
+        self.text = text
+        self.rating = rating
+        self.helpful = helpful
+        self.meta = meta
+        self.country = country
+        self.date = date
+
+    @classmethod
+    def parse(cls, review_id: str, title: Optional[str], text: Optional[str],
+              rating_text: Optional[str], meta: Optional[str], helpful_text: Optional[str] = None) -> 'Review':
+        """From the strings on the page ("4.0 out of 5 stars", "Reviewed in ... on ...")."""
+        country, review_date = parse_review_meta(meta)
+        return cls(review_id, title, text, parse_float(rating_text), parse_helpful(helpful_text),
+                   meta, country, review_date)
+
+    @classmethod
+    def from_dict(cls, data) -> 'Review':
+        if isinstance(data, cls):
+            return data
+        if 'ratings' in data:
+            return cls.parse(data.get('review_id'), data.get('title'), data.get('text'),
+                             data.get('ratings'), data.get('meta'), data.get('helpful'))
+        review_date = data.get('date')
+        return cls(data.get('review_id'), data.get('title'), data.get('text'), data.get('rating'),
+                   data.get('helpful'), data.get('meta'), data.get('country'),
+                   date.fromisoformat(review_date) if review_date else None)
+
+    def to_dict(self) -> dict:
+        return {
+            'review_id': self.review_id,
+            'title': self.title,
+            'text': self.text,
+            'rating': self.rating,
+            'helpful': self.helpful,
+            'meta': self.meta,
+            'country': self.country,
+            'date': self.date.isoformat() if self.date else None,
+        }
+
+    def __eq__(self, other):
+        if not isinstance(other, Review):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return f"Review({self.review_id!r}, rating={self.rating!r}, date={self.date!r})"
+
+
+class Question:
+    """One Q&A item, with its vote count parsed once when scraped.
+
+    ``all_answers`` is filled in later from the "see all answers" page, when
+    there is one.
+    """
+
+    __slots__ = ('question_id', 'question', 'answer', 'votes', 'all_answers')
+
+    def __init__(self, question_id: str,
+                 question: Optional[str] = None,
+                 answer: Optional[str] = None,
+                 votes: Optional[int] = None,
+                 all_answers: Optional[list] = None):
+        self.question_id = question_id
+        self.question = question
+        self.answer = answer
+        self.votes = votes
+        self.all_answers = all_answers
+
+    @classmethod
+    def parse(cls, question_id: str, question: Optional[str], answer: Optional[str],
+              votes_text: Optional[str]) -> 'Question':
+        return cls(question_id, question, answer, parse_int(votes_text))
+
+    @classmethod
+    def from_dict(cls, data) -> 'Question':
+        if isinstance(data, cls):
+            return data
+        return cls(data.get('question_id'), data.get('question'), data.get('answer'),
+                   parse_int(data.get('votes')), data.get('all_answers'))
+
+    def to_dict(self) -> dict:
+        return {
+            'question_id': self.question_id,
+            'question': self.question,
+            'answer': self.answer,
+            'votes': self.votes,
+            'all_answers': self.all_answers,
+        }
+
+    def __eq__(self, other):
+        if not isinstance(other, Question):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return f"Question({self.question_id!r}, votes={self.votes!r})"
+
+
+def to_json(value):
+    """``json.dumps(default=...)`` hook for the record classes."""
+    if isinstance(value, (Review, Question)):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
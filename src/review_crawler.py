@@ -0,0 +1,107 @@
+import asyncio
+from typing import AsyncIterator, Optional
+
+import config
+from extract_pool import ExtractionPool
+from extraction import ReviewPageExtractor
+from governor import BlockedError
+from http_client import HttpClient, HttpError, looks_blocked
+from metrics import get_metrics
+from selector_spec import SelectorSpec, get_spec
+from snapshot_cache import REVIEWS, SnapshotCache
+
+REVIEWS_URL = config.AMAZON_BASE_URL + "/product-reviews/{asin}/?pageNumber={page}&sortBy={sort}"
+
+
+def add_new_reviews(reviews: list, unique_review_ids: set, scrape_info: list) -> bool:
+    """Append the ``(review_id, record)`` pairs not seen yet; False when there were none."""
+    reviews_added = False
+    for review_id, review_details in reviews:
+        if review_id not in unique_review_ids:
+            unique_review_ids.add(review_id)
+            reviews_added = True
+            scrape_info.append(review_details)
+    return reviews_added
+
+
+class ReviewCrawler:
+    """Fetches paginated review pages straight over HTTP.
+
+    Pages are requested ``concurrency`` at a time and processed in page order;
+    crawling stops at the first page that yields no review IDs that were not
+    already seen. When ``known_ids`` from an earlier crawl are passed in, those
+    reviews are skipped and the window starts at one page and doubles, so a
+    refresh with nothing new costs a single request.
+    """
+
+    def __init__(self, http_client: HttpClient,
+                 spec: Optional[SelectorSpec] = None,
+                 concurrency: int = config.REVIEW_PAGE_CONCURRENCY,
+                 max_pages: int = config.REVIEW_MAX_PAGES,
+                 sort: str = config.REVIEW_SORT,
+                 base_url: str = REVIEWS_URL,
+                 snapshot_cache: Optional[SnapshotCache] = None,
+                 extract_pool: Optional[ExtractionPool] = None):
+        self.http_client = http_client
+        self.spec = spec or get_spec()
+        self.concurrency = concurrency
+        self.max_pages = max_pages
+        self.sort = sort
+        self.base_url = base_url
+        self.snapshot_cache = snapshot_cache
+        self.extract_pool = extract_pool
+
+    def page_url(self, asin: str, page: int) -> str:
+        return self.base_url.format(asin=asin, page=page, sort=self.sort)
+
+    async def fetch_page(self, asin: str, page: int) -> list:
+        """The reviews on one page, [] past the last one.
+
+        The request runs under the HTTP client's governor, which paces it and
+        retries errors and bot check pages with backoff; only a 404 (or a page
+        without reviews) ends the crawl.
+        """
+        url = self.page_url(asin, page)
+
+        async def attempt():
+            try:
+                content = await self.http_client.fetch_text(url)
+            except HttpError as e:
+                if e.status == 404:
+                    return None
+                raise
+            if looks_blocked(content):
+                raise BlockedError(f"Bot check page for {url}")
+            return content
+
+        content = await self.http_client.governor.run(url, attempt)
+        if content is None:
+            return []
+        if self.snapshot_cache is not None:
+            self.snapshot_cache.put(REVIEWS, asin, page, url, content)
+        if self.extract_pool is not None:
+            return await self.extract_pool.extract_review_page(content, url)
+        with get_metrics().timer('extract_review_page'):
+            extractor = ReviewPageExtractor(content, url, self.spec)
+            reviews = extractor.timed('reviews', extractor.reviews)
+        get_metrics().record_timings('extract', extractor.timings)
+        return reviews
+
+    async def crawl(self, asin: str, known_ids: Optional[set] = None) -> list:
+        return [review async for batch in self.iter_pages(asin, known_ids) for review in batch]
+
+    async def iter_pages(self, asin: str, known_ids: Optional[set] = None) -> AsyncIterator[list]:
+        """The new reviews of each page, in page order, as ``crawl`` finds them."""
+        unique_review_ids = set(known_ids or ())
+        window = 1 if known_ids else self.concurrency
+        page = 1
+        while page <= self.max_pages:
+            last = min(page + window, self.max_pages + 1)
+            window = min(window * 2, self.concurrency)
+            pages = await asyncio.gather(*(self.fetch_page(asin, n) for n in range(page, last)))
+            for reviews in pages:
+                batch = []
+                if not add_new_reviews(reviews, unique_review_ids, batch):
+                    return
+                yield batch
+            page = last
@@ -0,0 +1,71 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Iterable, Tuple
+
+import config
+from metrics import get_metrics
+
+
+class ScrapeScheduler:
+    """Runs product scrapes concurrently off a work queue.
+
+    ``max_concurrency`` bounds the number of products in flight; the static and
+    dynamic semaphores additionally bound how many products may be in each
+    stage at once and are handed to the scrape coroutine to acquire.
+    """
+
+    def __init__(self,
+                 max_concurrency: int = config.MAX_CONCURRENCY,
+                 max_static: int = config.MAX_STATIC_CONCURRENCY,
+                 max_dynamic: int = config.MAX_DYNAMIC_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self.static_limit = asyncio.Semaphore(max_static)
+        self.dynamic_limit = asyncio.Semaphore(max_dynamic)
+
+    async def _worker(self, queue: asyncio.Queue, scrape, on_done):
+        while True:
+            item = await queue.get()
+            if item is None:
+                queue.task_done()
+                return
+            key, url = item
+            start = time.perf_counter()
+            try:
+                await scrape(url, self.static_limit, self.dynamic_limit)
+                self._record(start, 'done')
+                on_done(key, url, None)
+            except Exception as e:
+                self._record(start, 'failed')
+                on_done(key, url, e)
+            finally:
+                queue.task_done()
+
+    @staticmethod
+    def _record(start: float, outcome: str):
+        metrics = get_metrics()
+        metrics.inc('scraper_products_total', outcome=outcome)
+        metrics.observe('scraper_product_seconds', time.perf_counter() - start, outcome=outcome)
+
+    async def run(self,
+                  items: Iterable[Tuple[object, str]],
+                  scrape: Callable[..., Awaitable],
+                  on_done: Callable[[object, str, Exception], None]):
+        """Scrape every ``(key, url)`` in ``items``.
+
+        Args:
+            items: pairs of row key and product URL
+            scrape: coroutine function called as ``scrape(url, static_limit, dynamic_limit)``
+            on_done: called with ``(key, url, error)`` after each URL, ``error`` is None on success
+        """
+        queue = asyncio.Queue(maxsize=self.max_concurrency * 2)
+        workers = [asyncio.create_task(self._worker(queue, scrape, on_done))
+                   for _ in range(self.max_concurrency)]
+        try:
+            for item in items:
+                await queue.put(item)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
@@ -1,84 +1,360 @@
+import argparse
 import asyncio
+import functools
 import json
-import random
-import re
 import time
+import uuid
+from contextlib import nullcontext
 from typing import Optional
 
-import lxml
-import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-from playwright.async_api import TimeoutError, async_playwright
-
+import config
+from browser_pool import BrowserPool, proxy_settings
 from dynamic import DynamicScraper
+from extract_pool import ExtractionPool
+from extraction import ProductExtractor, ReviewPageExtractor
+from fetch_stats import FetchStats
+from governor import get_governor
+from http_client import HttpClient
+from job_store import JobStore
+from metrics import get_metrics
+from output_sink import ChildStreams, JsonlSink
+from parquet_export import ParquetExporter
+from proxy_pool import ProxyPool
+from request_blocker import RequestBlocker
+from review_crawler import add_new_reviews
+from scheduler import ScrapeScheduler
+from seen_ids import SeenIdStore
+from selector_spec import get_spec
+from snapshot_cache import PRODUCT, REVIEWS, SnapshotCache
 from static import StaticScraper
+from urls import extract_asin
 
 
-async def run_scraper(url):
-        static_scraper = StaticScraper(url, use_proxy= False)
-        #INITIALIZE WIRH PROXY PARAMS AND CREDENTIALS IF USING PROXY
-        await static_scraper.initialize()
-        
-        static_scraped_data = await static_scraper.run_static_scraper()
-        print(json.dumps(static_scraped_data, indent = 4))
-        
-        dynamic_scraper = DynamicScraper(url, product_data= static_scraped_data, use_proxy= False)
-        #INITIALIZE WIRH PROXY PARAMS AND CREDENTIALS IF USING PROXY
-        
-        scraped_data = await dynamic_scraper.run_dynamic_scraper()
-        print(json.dumps(scraped_data, indent = 4))
-        
-        with open('../outputs/outputs.json', 'a') as f:
-            f.write(json.dumps(scraped_data, ensure_ascii=False) + '\n')
+async def scrape_product(url, browser_pool: BrowserPool,
+                         static_limit: Optional[asyncio.Semaphore] = None,
+                         dynamic_limit: Optional[asyncio.Semaphore] = None,
+                         http_client: Optional[HttpClient] = None,
+                         fetch_stats: Optional[FetchStats] = None,
+                         wait_stats: Optional[FetchStats] = None,
+                         snapshot_cache: Optional[SnapshotCache] = None,
+                         extract_pool: Optional[ExtractionPool] = None,
+                         seen_ids: Optional[SeenIdStore] = None,
+                         incremental: bool = config.INCREMENTAL,
+                         child_streams: Optional[ChildStreams] = None,
+                         scrape_id: Optional[str] = None) -> dict:
+        # Stages: static -> reviews, and Q&A as soon as the ASIN is known (from the
+        # URL when possible, otherwise from the static result). Each stage merges
+        # its result into product_data when it finishes; with child_streams
+        # reviews and Q&A are written out as they come and only counted.
+        product_data = {}
+        if child_streams is not None:
+            product_data['scrape_id'] = scrape_id
+        metrics = get_metrics()
+        with metrics.trace(url):
+            async def static_stage():
+                async with static_limit or nullcontext():
+                    with metrics.timer('static'):
+                        static_scraper = StaticScraper(url, browser_pool, use_proxy= False,
+                                                       http_client= http_client, fetch_stats= fetch_stats,
+                                                       snapshot_cache= snapshot_cache, extract_pool= extract_pool)
+                        #INITIALIZE WIRH PROXY PARAMS AND CREDENTIALS IF USING PROXY
+                        await static_scraper.initialize()
 
-def correct_json_file(input_file, output_file):
-        with open(input_file, 'r') as file:
-            content = file.read().strip()
-    
-    # Use a regular expression to insert a comma before '{' when it is directly followed by '"product_name"', accounting for any type and amount of whitespace between '}' and '{'
-        corrected_content = re.sub(r'}\s*(?=\s*{\s*"\s*product_name")', '},', content)
-        
-        # Wrap the whole content in square brackets to form a valid JSON array
-        corrected_content = f'[{corrected_content}]'
+                        static_scraped_data = await static_scraper.run_static_scraper()
+                print(json.dumps(static_scraped_data, indent = 4))
+                product_data.update(static_scraped_data)
+
+            async def dynamic_stage(run, stage):
+                async with dynamic_limit or nullcontext():
+                    with metrics.timer(stage):
+                        await run()
+
+            static_task = asyncio.create_task(static_stage())
+            qa_task = None
+            try:
+                asin = extract_asin(url)
+                if asin is None:
+                    await static_task
+                    asin = product_data['ASIN']
+            
+                dynamic_scraper = DynamicScraper(url, product_data= product_data, browser_pool= browser_pool, use_proxy= False,
+                                                 wait_stats= wait_stats,
+                                                 http_client= http_client if config.HTTP_REVIEWS else None,
+                                                 asin= asin, snapshot_cache= snapshot_cache,
+                                                 extract_pool= extract_pool,
+                                                 seen_ids= seen_ids if incremental else None,
+                                                 child_streams= child_streams, scrape_id= scrape_id)
+                #INITIALIZE WIRH PROXY PARAMS AND CREDENTIALS IF USING PROXY
+                qa_task = asyncio.create_task(dynamic_stage(dynamic_scraper.run_qa_stage, 'qa'))
+            
+                await static_task
+                await asyncio.gather(dynamic_stage(dynamic_scraper.run_reviews_stage, 'reviews'), qa_task)
+            except BaseException:
+                for task in (static_task, qa_task):
+                    if task is not None:
+                        task.cancel()
+                raise
         
-        with open(output_file, 'w') as file:
-            file.write(corrected_content)
-    
+            product_data['fully_scraped'] = True
+            if incremental and seen_ids is not None:
+                # Reviews and QA only hold what was not in an earlier record
+                product_data['incremental'] = True
+            print(f"Scraped {url}: {product_data.get('review_count', len(product_data.get('Reviews') or ()))} reviews, "
+                  f"{product_data.get('qa_count', len(product_data.get('QA') or ()))} questions")
+            return product_data
+
+
+def record_written(scraped_data: dict, url: str,
+                   exporter: Optional[ParquetExporter] = None,
+                   seen_ids: Optional[SeenIdStore] = None,
+                   child_streams: Optional[ChildStreams] = None):
+    """Bookkeeping once a record is in the output: Parquet tables and seen review/question IDs."""
+    streamed_ids = child_streams.finish(scraped_data['scrape_id']) if child_streams is not None else None
+    if exporter is not None:
+        exporter.add(scraped_data)
+    if seen_ids is not None:
+        seen_ids.add_record(scraped_data, extract_asin(url) or scraped_data['ASIN'], streamed_ids)
+
+
+class ScrapeSession:
+    """The long-lived pieces one scraping process shares across all its products.
+
+    Browser pool, HTTP client, proxy pool, request blocker, extraction pool,
+    snapshot cache, seen-ID store, child streams, Parquet exporter and stats are built from
+    config, started on ``__aenter__`` and closed on ``__aexit__``. While the
+    session is open, metrics are served on SCRAPER_METRICS_PORT (when set)
+    and dumped to SCRAPER_METRICS_DUMP every SCRAPER_METRICS_DUMP_INTERVAL seconds.
+    A ``browser_pool`` passed in is used instead of one built from config.
+    """
+
+    def __init__(self, browser_pool: Optional[BrowserPool] = None):
+        self.proxy_pool = ProxyPool.from_config()
+        self.request_blocker = RequestBlocker() if config.BLOCK_RESOURCES else None
+        if browser_pool is None:
+            browser_pool = BrowserPool(proxy=proxy_settings(config.PROXY_SERVER, config.PROXY_USERNAME,
+                                                            config.PROXY_PASSWORD),
+                                       proxy_pool=self.proxy_pool, request_blocker=self.request_blocker)
+        self.browser_pool = browser_pool
+        self.http_client = HttpClient(proxy=config.PROXY_SERVER,
+                                      proxy_username=config.PROXY_USERNAME,
+                                      proxy_password=config.PROXY_PASSWORD,
+                                      proxy_pool=self.proxy_pool) if config.HTTP_FIRST else None
+        self.fetch_stats = FetchStats()
+        self.wait_stats = FetchStats()
+        self.exporter = ParquetExporter() if config.PARQUET_DIR else None
+        self.snapshot_cache = SnapshotCache() if config.SNAPSHOT_CACHE else None
+        self.extract_pool = ExtractionPool()
+        self.seen_ids = SeenIdStore()
+        self.child_streams = ChildStreams(on_batch=self.exporter.add_batch if self.exporter is not None else None) \
+            if config.STREAM_CHILDREN else None
+        self.metrics = get_metrics()
+        self._metrics_runner = None
+        self._metrics_dump = None
+
+        self.metrics.gauge('scraper_browser_open_pages', lambda: self.browser_pool.open_pages,
+                           "Pages currently borrowed from the browser pool")
+        self.metrics.gauge('scraper_governor_rate_scale', lambda: get_governor().scale,
+                           "Share of the configured request rate the governor allows")
+        if self.proxy_pool is not None:
+            self.metrics.gauge('scraper_proxies_healthy', lambda: self.proxy_pool.metrics()['healthy'])
+        if self.request_blocker is not None:
+            self.metrics.gauge('scraper_requests_blocked', lambda: sum(self.request_blocker.blocked.values()),
+                               "Browser requests aborted by the request blocker")
+
+    async def __aenter__(self):
+        if config.METRICS_PORT:
+            self._metrics_runner = await self.metrics.serve()
+        if config.METRICS_DUMP_PATH:
+            self._metrics_dump = asyncio.create_task(
+                self.metrics.dump_every(config.METRICS_DUMP_PATH, config.METRICS_DUMP_INTERVAL))
+        await self.browser_pool.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def scrape(self, url: str,
+                     static_limit: Optional[asyncio.Semaphore] = None,
+                     dynamic_limit: Optional[asyncio.Semaphore] = None) -> dict:
+        scrape_id = uuid.uuid4().hex
+        try:
+            return await scrape_product(url, self.browser_pool, static_limit, dynamic_limit,
+                                        http_client=self.http_client, fetch_stats=self.fetch_stats,
+                                        wait_stats=self.wait_stats, snapshot_cache=self.snapshot_cache,
+                                        extract_pool=self.extract_pool, seen_ids=self.seen_ids,
+                                        child_streams=self.child_streams, scrape_id=scrape_id)
+        except BaseException:
+            if self.child_streams is not None:
+                self.child_streams.discard(scrape_id)
+            raise
+
+    def written(self, scraped_data: dict, url: str):
+        record_written(scraped_data, url, self.exporter, self.seen_ids, self.child_streams)
+
+    async def close(self):
+        if self.child_streams is not None:
+            self.child_streams.close()
+        if self.exporter is not None:
+            self.exporter.close()
+        if self.snapshot_cache is not None:
+            self.snapshot_cache.close()
+        self.extract_pool.close()
+        self.seen_ids.close()
+        await self.browser_pool.close()
+        if self.http_client is not None:
+            await self.http_client.close()
+        if self._metrics_dump is not None:
+            self._metrics_dump.cancel()
+            self.metrics.dump(config.METRICS_DUMP_PATH)
+        if self._metrics_runner is not None:
+            await self._metrics_runner.cleanup()
+
+    def report(self):
+        self.fetch_stats.report()
+        self.wait_stats.report()
+        get_governor().report()
+        if self.proxy_pool is not None:
+            self.proxy_pool.report()
+        if self.request_blocker is not None:
+            self.request_blocker.report()
+        for series, stats in self.metrics.snapshot()['histograms'].items():
+            print(f"[{series}] count={stats['count']} mean={stats['mean_s']:.3f}s "
+                  f"p50<={stats['p50_s']:g}s p95<={stats['p95_s']:g}s")
+
+
+def extract_cached_product(snapshot_cache: SnapshotCache, key: str, touch: bool = True) -> Optional[dict]:
+    """Product record for one cached product page plus its cached review pages, None on failure."""
+    snapshot = snapshot_cache.get(PRODUCT, key, touch=touch)
+    if snapshot is None:
+        return None
+    url, content, _ = snapshot
+    spec = get_spec()
+    try:
+        product_data = ProductExtractor(content, url, spec).extract()
+    except Exception as e:
+        print(f"{e} at cached product {key}")
+        return None
+
+    asin = product_data.get('ASIN') or key
+    pages = snapshot_cache.pages(REVIEWS, asin)
+    if pages:
+        reviews, unique_review_ids = [], set()
+        for page in pages:
+            snapshot = snapshot_cache.get(REVIEWS, asin, page, touch=touch)
+            if snapshot is None:  # expired or evicted since it was listed
+                break
+            page_url, page_content, _ = snapshot
+            page_reviews = ReviewPageExtractor(page_content, page_url, spec).reviews()
+            if not add_new_reviews(page_reviews, unique_review_ids, reviews):
+                break
+        product_data['Reviews'] = reviews
+    return product_data
+
+
+_worker_snapshot_caches = {}
+
+
+def _extract_cached_in_worker(item: tuple) -> Optional[dict]:
+    # runs in an ExtractionPool worker, which opens the cache index once and only reads from it
+    directory, key = item
+    if directory not in _worker_snapshot_caches:
+        _worker_snapshot_caches[directory] = SnapshotCache(directory)
+    return extract_cached_product(_worker_snapshot_caches[directory], key, touch=False)
+
+
+def extract_from_cache(snapshot_cache: SnapshotCache, sink: JsonlSink,
+                       exporter: Optional[ParquetExporter] = None,
+                       extract_pool: Optional[ExtractionPool] = None) -> int:
+    """Re-run the product and review extractors over cached snapshots, without any network.
+
+    Q&A is read from the live page in the browser and is not part of these
+    records, so they keep ``fully_scraped`` False. With ``extract_pool`` the
+    products are parsed in its worker processes.
+
+    Returns:
+        int: number of products written
+    """
+    keys = snapshot_cache.keys(PRODUCT)
+    if extract_pool is None:
+        records = (extract_cached_product(snapshot_cache, key) for key in keys)
+    else:
+        records = extract_pool.imap(_extract_cached_in_worker, ((snapshot_cache.directory, key) for key in keys))
+
+    written = 0
+    for product_data in records:
+        if product_data is None:
+            continue
+        sink.write(product_data)
+        if exporter is not None:
+            exporter.add(product_data)
+        written += 1
+    return written
+
+
+def main_from_cache():
+    sink = JsonlSink()
+    exporter = ParquetExporter() if config.PARQUET_DIR else None
+    start = time.perf_counter()
+    with SnapshotCache() as snapshot_cache, ExtractionPool() as extract_pool:
+        try:
+            written = extract_from_cache(snapshot_cache, sink, exporter, extract_pool)
+        finally:
+            sink.close()
+            if exporter is not None:
+                exporter.close()
+    print(f"Re-extracted {written} products from {config.SNAPSHOT_DIR} in {time.perf_counter() - start:.1f}s")
+
 
 async def main():
-    data = pd.read_csv("../data/dedup_urls.csv")
-    
-    if 'scraping' not in data.columns:
-        data.insert(loc = 1, column = "scraping", value = 0)
-        
-    # Filter the DataFrame based on the condition  that scraping has not been attempted
-    filtered_data = data[data['scraping'] == 0]
+    store = JobStore()
+    if not store.counts():
+        print(f"Imported {store.import_csv(config.URLS_CSV)} URLs from {config.URLS_CSV}")
+    requeued = store.recover()
+    if requeued:
+        print(f"Requeued {requeued} URLs left running by an earlier run")
 
-    # Sample unscraped 100 rows from the filtered DataFrame
-    selected_rows = filtered_data.sample(5)
-    # selected_rows = data.sample(100)
+    # Claim unscraped URLs for this batch
+    selected_rows = store.claim(config.BATCH_SIZE)
     print(selected_rows)
-    for idx, row in selected_rows.iterrows():
-        url = row['product URL'] 
+    results = {}  # url -> (output path, line, ASIN) of its record
+
+    def mark_row(job_id, url, error):
+        if error is None:
+            output_path, output_line, asin = results.pop(url)
+            # the job is marked done once its record is fsynced (every OUTPUT_FSYNC_EVERY records)
+            sink.when_synced(functools.partial(store.mark_done, job_id, output_path, output_line, asin=asin))
+            return
+        print(f"Exception: {error}")
+        with open('../outputs/failed_urls.txt', 'a') as f:
+            f.write(f"{url}\n")
+        store.mark_failed(job_id, repr(error))
+
+    sink = JsonlSink()
+
+    async def scrape(url, static_limit, dynamic_limit):
+        scraped_data = await session.scrape(url, static_limit, dynamic_limit)
+        results[url] = (*sink.write(scraped_data), scraped_data.get('ASIN'))
+        session.written(scraped_data, url)
+
+    async with ScrapeSession() as session:
         try:
-            await run_scraper(url)
-            data.at[idx, 'scraping'] = 1
-            # flag to indicate successful scaraping
-        except Exception as e:
-            print(f"Exception: {e}")
-            with open('../outputs/failed_urls.txt', 'a') as f:
-                f.write(f"{url}\n")
-                # flag to indicate unsuccessful scraping
-                data.at[idx, 'scraping'] = -1
-                continue
-    correct_json_file(input_file='../outputs/outputs.json', output_file= '../outputs/outputs.json' )
-    
-    data.to_csv('../outputs/marked_dedup_urls.csv')
+            scheduler = ScrapeScheduler()
+            await scheduler.run(selected_rows, scrape=scrape, on_done=mark_row)
+        finally:
+            sink.close()
+            store.close()
+    session.report()
     
         
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Scrape a batch of product URLs")
+    parser.add_argument('--from-cache', action='store_true',
+                        help="re-extract every cached snapshot instead of crawling (no network)")
+    args = parser.parse_args()
+    if args.from_cache:
+        main_from_cache()
+    else:
+        asyncio.run(main())
             
         
             
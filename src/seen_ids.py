@@ -0,0 +1,75 @@
+import sqlite3
+import time
+from typing import Iterable, Optional
+
+import config
+from output_sink import QA_STREAM, REVIEW_STREAM
+from records import Question, Review
+
+REVIEW = 'review'
+QUESTION = 'question'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen_ids (
+    asin       TEXT NOT NULL,
+    kind       TEXT NOT NULL,
+    item_id    TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    PRIMARY KEY (asin, kind, item_id)
+) WITHOUT ROWID;
+"""
+
+
+class SeenIdStore:
+    """Review and question IDs already written out, per ASIN (SQLite, WAL mode).
+
+    Incremental re-scrapes seed their pagination with these so they stop at
+    the first page that has nothing new and only emit the delta.
+    """
+
+    def __init__(self, path: str = config.SEEN_IDS_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def load(self, asin: str, kind: str) -> set:
+        return {item_id for (item_id,) in self.conn.execute(
+            "SELECT item_id FROM seen_ids WHERE asin = ? AND kind = ?", (asin, kind))}
+
+    def add(self, asin: str, kind: str, item_ids: Iterable[str]):
+        now = time.time()
+        rows = [(asin, kind, item_id, now) for item_id in item_ids if item_id]
+        if not rows:
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany("INSERT OR IGNORE INTO seen_ids (asin, kind, item_id, first_seen) "
+                                  "VALUES (?, ?, ?, ?)", rows)
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def add_record(self, product_data: dict, asin: str, streamed_ids: Optional[dict] = None):
+        """Remember the review and question IDs of a record that was written out.
+
+        ``streamed_ids`` are the IDs its reviews and Q&A were streamed with
+        (``ChildStreams.finish``), keyed by stream.
+        """
+        streamed_ids = streamed_ids or {}
+        self.add(asin, REVIEW, (Review.from_dict(review).review_id for review in product_data.get('Reviews') or []))
+        self.add(asin, REVIEW, streamed_ids.get(REVIEW_STREAM, ()))
+        self.add(asin, QUESTION, (Question.from_dict(qa).question_id for qa in product_data.get('QA') or []))
+        self.add(asin, QUESTION, streamed_ids.get(QA_STREAM, ()))
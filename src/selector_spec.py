@@ -0,0 +1,192 @@
+import json
+import os
+from typing import Optional
+
+from lxml import etree
+
+import config
+
+
+def _literal(value: str) -> str:
+    if "'" not in value:
+        return f"'{value}'"
+    if '"' not in value:
+        return f'"{value}"'
+    parts = value.split("'")
+    return "concat(" + ", \"'\", ".join(f"'{part}'" for part in parts) + ")"
+
+
+def has_class(name: str) -> str:
+    """XPath predicate matching a single class token."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def class_is(value: str) -> str:
+    """XPath predicate matching the whole class attribute."""
+    return f"normalize-space(@class)={_literal(value)}"
+
+
+def selector_to_xpath(rule: dict) -> str:
+    """Build an XPath expression from a selector rule.
+
+    A rule either gives ``xpath`` verbatim or describes the element with
+    ``tag``, ``class`` (one or more class tokens), ``class_is`` (the whole
+    class attribute), ``attrs`` and ``text`` (the element's string value).
+    ``scope`` is ``descendant`` (default, relative to the context element) or
+    ``document``.
+    """
+    if 'xpath' in rule:
+        return rule['xpath']
+    predicates = []
+    classes = rule.get('class', [])
+    for name in [classes] if isinstance(classes, str) else classes:
+        predicates.append(has_class(name))
+    if 'class_is' in rule:
+        predicates.append(class_is(rule['class_is']))
+    for attr, value in rule.get('attrs', {}).items():
+        predicates.append(f"@{attr}={_literal(value)}")
+    if 'text' in rule:
+        predicates.append(f".={_literal(rule['text'])}")
+    axis = '//' if rule.get('scope') == 'document' else './/'
+    return axis + rule.get('tag', '*') + ''.join(f'[{p}]' for p in predicates)
+
+
+class Selector:
+    """A compiled selector rule.
+
+    ``id`` rules are answered from the page's id index; everything else runs
+    a precompiled XPath expression against the context element.
+    """
+    __slots__ = ('name', 'id', 'tag', 'text', 'xpath')
+
+    def __init__(self, name: str, rule: dict):
+        self.name = name
+        self.id = rule.get('id')
+        self.tag = rule.get('tag')
+        self.text = rule.get('text')
+        self.xpath = None if self.id is not None else etree.XPath(selector_to_xpath(rule))
+
+    def select(self, element, ids: dict) -> list:
+        if self.id is not None:
+            found = ids.get(self.id)
+            if found is None or (self.tag is not None and found.tag != self.tag):
+                return []
+            return [found]
+        return self.xpath(element)
+
+
+class SelectorChain:
+    """Selectors applied one after another, each within the previous match."""
+    __slots__ = ('selectors',)
+
+    def __init__(self, name: str, rules: list):
+        self.selectors = [Selector(f"{name}[{i}]", rule) for i, rule in enumerate(rules)]
+
+    def select(self, element, ids: dict) -> list:
+        found = [element]
+        for selector in self.selectors:
+            if not found:
+                return []
+            found = selector.select(found[0], ids)
+        return found
+
+
+def compile_selector(name: str, rule):
+    if isinstance(rule, list):
+        return SelectorChain(name, rule)
+    return Selector(name, rule)
+
+
+POST_PROCESSORS = {
+    'strip': lambda value: value.strip(),
+    'digits_int': lambda value: int(''.join(filter(str.isdigit, value))),
+}
+
+
+class Field:
+    """An output key, the selectors tried in order to find it and its post-processing.
+
+    ``post`` starts with ``text`` or ``text_strip`` to turn the matched element
+    into a string, followed by any of ``POST_PROCESSORS``. When nothing matches
+    the field is ``default``, unless it is ``required``.
+    """
+    __slots__ = ('name', 'selectors', 'post', 'default', 'required')
+
+    def __init__(self, name: str, rule: dict):
+        self.name = name
+        self.selectors = [compile_selector(f"{name}.select[{i}]", select)
+                          for i, select in enumerate(rule['select'])]
+        self.post = rule.get('post', ['text'])
+        self.default = rule.get('default')
+        self.required = rule.get('required', False)
+        unknown = [step for step in self.post
+                   if step not in POST_PROCESSORS and step not in ('text', 'text_strip')]
+        if unknown:
+            raise ValueError(f"Unknown post-processing {unknown} for field {name}")
+
+
+# Sections compiled into lxml selectors; every other section is Playwright CSS
+LXML_SECTIONS = ('product', 'review_page')
+
+
+class SelectorSpec:
+    """Compiled form of the selector spec file.
+
+    The ``LXML_SECTIONS`` hold the selectors and fields used by the lxml page
+    extractors; every other section holds CSS selectors passed as-is to
+    Playwright.
+    """
+
+    def __init__(self, raw: dict, path: Optional[str] = None):
+        self.path = path
+        self.version = raw.get('version')
+        self.selectors = {}
+        self.fields = {}
+        for section in LXML_SECTIONS:
+            rules = raw.get(section, {})
+            self.selectors[section] = {name: compile_selector(f"{section}.{name}", rule)
+                                       for name, rule in rules.get('selectors', {}).items()}
+            self.fields[section] = {name: Field(f"{section}.{name}", rule)
+                                    for name, rule in rules.get('fields', {}).items()}
+        self.css_sections = {section: dict(rules) for section, rules in raw.items()
+                             if section != 'version' and section not in LXML_SECTIONS}
+
+    def selector(self, name: str, section: str = 'product'):
+        return self.selectors[section][name]
+
+    def field(self, name: str, section: str = 'product') -> Field:
+        return self.fields[section][name]
+
+    def css(self, section: str, name: str, **params) -> str:
+        css = self.css_sections[section][name]
+        return css.format(**params) if params else css
+
+
+_cache = {}
+
+
+def load_spec(path: str) -> SelectorSpec:
+    with open(path, 'r', encoding='utf-8') as f:
+        return SelectorSpec(json.load(f), path)
+
+
+def get_spec(path: Optional[str] = None) -> SelectorSpec:
+    """Return the compiled spec at ``path``, recompiling only when the file has changed.
+
+    Editing the spec file swaps in the new rules for every page fetched after
+    the change, without restarting the scraper.
+    """
+    path = path or config.SELECTOR_SPEC_PATH
+    mtime = os.stat(path).st_mtime_ns
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    try:
+        spec = load_spec(path)
+    except Exception as e:
+        if cached is None:
+            raise
+        print(f"Failed to reload selector spec {path}, keeping previous version: {e}")
+        spec = cached[1]
+    _cache[path] = (mtime, spec)
+    return spec
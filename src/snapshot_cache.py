@@ -0,0 +1,167 @@
+import gzip
+import hashlib
+import os
+import sqlite3
+import time
+from typing import Iterator, Optional
+
+import config
+
+PRODUCT = 'product'
+REVIEWS = 'reviews'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    size   INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    kind        TEXT NOT NULL,
+    key         TEXT NOT NULL,
+    page        INTEGER NOT NULL,
+    url         TEXT NOT NULL,
+    digest      TEXT NOT NULL REFERENCES blobs(digest),
+    fetched_at  REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (kind, key, page)
+);
+CREATE INDEX IF NOT EXISTS snapshots_accessed ON snapshots(accessed_at);
+CREATE INDEX IF NOT EXISTS snapshots_digest ON snapshots(digest);
+"""
+
+
+class SnapshotCache:
+    """Raw page HTML kept on disk so extraction can be re-run without crawling.
+
+    Snapshots are addressed by ``(kind, key, page)`` where ``kind`` is
+    ``product`` or ``reviews``, ``key`` is the ASIN (or the URL when it has no
+    ASIN) and ``page`` the page number. The HTML itself is stored gzipped under
+    ``<directory>/blobs/`` by its SHA-256, so identical pages are stored once;
+    the index lives in ``<directory>/index.sqlite3``. Snapshots older than
+    ``ttl`` seconds are never returned and are dropped on eviction, along
+    with the least recently used ones whenever the blobs grow past
+    ``max_bytes``.
+    """
+
+    def __init__(self,
+                 directory: str = config.SNAPSHOT_DIR,
+                 max_bytes: int = config.SNAPSHOT_MAX_BYTES,
+                 ttl: float = config.SNAPSHOT_TTL,
+                 evict_every: int = 100):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.evict_every = evict_every
+        self._puts = 0
+
+        os.makedirs(os.path.join(directory, 'blobs'), exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(directory, 'index.sqlite3'), isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.evict()
+        self.conn.close()
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, 'blobs', digest[:2], f"{digest}.html.gz")
+
+    def put(self, kind: str, key: str, page: int, url: str, content: str):
+        data = content.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(gzip.compress(data, compresslevel=6))
+            os.replace(tmp, path)
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute("INSERT OR IGNORE INTO blobs (digest, size) VALUES (?, ?)",
+                              (digest, os.path.getsize(path)))
+            self.conn.execute("INSERT OR REPLACE INTO snapshots (kind, key, page, url, digest, fetched_at, accessed_at) "
+                              "VALUES (?, ?, ?, ?, ?, ?, ?)", (kind, key, page, url, digest, now, now))
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+        self._puts += 1
+        if self._puts % self.evict_every == 0:
+            self.evict()
+
+    def get(self, kind: str, key: str, page: int = 1, touch: bool = True) -> Optional[tuple]:
+        """``(url, html, fetched_at)`` of a snapshot, or None when there is none or it has expired.
+
+        ``touch`` marks it as used for LRU eviction; readers in other
+        processes pass False so they never write to the index.
+        """
+        row = self.conn.execute("SELECT url, digest, fetched_at FROM snapshots "
+                                "WHERE kind = ? AND key = ? AND page = ? AND fetched_at >= ?",
+                                (kind, key, page, self._expires_before())).fetchone()
+        if row is None:
+            return None
+        url, digest, fetched_at = row
+        try:
+            with open(self.blob_path(digest), 'rb') as f:
+                content = gzip.decompress(f.read()).decode('utf-8')
+        except FileNotFoundError:
+            return None
+        if touch:
+            self.conn.execute("UPDATE snapshots SET accessed_at = ? WHERE kind = ? AND key = ? AND page = ?",
+                              (time.time(), kind, key, page))
+        return url, content, fetched_at
+
+    def keys(self, kind: str = PRODUCT) -> Iterator[str]:
+        for (key,) in self.conn.execute("SELECT DISTINCT key FROM snapshots WHERE kind = ? AND fetched_at >= ? "
+                                        "ORDER BY key", (kind, self._expires_before())):
+            yield key
+
+    def pages(self, kind: str, key: str) -> list:
+        return [page for (page,) in self.conn.execute(
+            "SELECT page FROM snapshots WHERE kind = ? AND key = ? AND fetched_at >= ? ORDER BY page",
+            (kind, key, self._expires_before()))]
+
+    def _expires_before(self) -> float:
+        """Snapshots fetched before this have expired."""
+        return time.time() - self.ttl
+
+    def total_bytes(self) -> int:
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def evict(self) -> int:
+        """Drop expired snapshots, then least recently used ones until under ``max_bytes``.
+
+        Returns:
+            int: number of blobs deleted
+        """
+        self.conn.execute("DELETE FROM snapshots WHERE fetched_at < ?", (self._expires_before(),))
+        deleted = self._delete_orphans()
+        while self.total_bytes() > self.max_bytes:
+            removed = self.conn.execute("DELETE FROM snapshots WHERE rowid IN "
+                                        "(SELECT rowid FROM snapshots ORDER BY accessed_at LIMIT 100)").rowcount
+            deleted += self._delete_orphans()
+            if not removed:
+                break
+        return deleted
+
+    def _delete_orphans(self) -> int:
+        orphans = [digest for (digest,) in self.conn.execute(
+            "SELECT digest FROM blobs WHERE digest NOT IN (SELECT digest FROM snapshots)")]
+        for digest in orphans:
+            try:
+                os.remove(self.blob_path(digest))
+            except FileNotFoundError:
+                pass
+        self.conn.executemany("DELETE FROM blobs WHERE digest = ?", [(digest,) for digest in orphans])
+        return len(orphans)
@@ -0,0 +1,67 @@
+import re
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+ASIN_RE = re.compile(r'/(?:dp|gp/product|gp/aw/d|o/ASIN|product-reviews|ask/questions/asin)/([A-Z0-9]{10})(?=[/?#&]|$)',
+                     re.IGNORECASE)
+
+# Query parameters that only track how the link was reached (search rank,
+# affiliate tags, placement IDs); dropped from canonical URLs
+TRACKING_PARAMS = {'ref', 'ref_', 'tag', 'linkcode', 'linkid', 'ascsubtag', 'camp', 'creative', 'creativeasin',
+                   'qid', 'sr', 'crid', 'sprefix', 'keywords', 'dib', 'dib_tag', 'content-id', 'th', 'psc',
+                   'smid', 'spla', 'sp_csd', '_encoding', 'dchild'}
+TRACKING_PREFIXES = ('pd_rd_', 'pf_rd_')
+# scheme, host[:port], path, query (urlsplit is several times slower on a big import)
+URL_RE = re.compile(r'([A-Za-z][A-Za-z0-9+.-]*)://([^/?#]*)([^?#]*)\??([^#]*)')
+# "/ref=sr_1_3" style path suffixes
+REF_PATH_RE = re.compile(r'/ref=[^/]*$')
+# Other front ends of the same store
+MIRROR_HOST_PREFIXES = ('smile.', 'm.')
+
+
+def extract_asin(url: str) -> Optional[str]:
+    """The ASIN in an Amazon product URL, or None if the URL doesn't carry one."""
+    match = ASIN_RE.search(url)
+    return match.group(1).upper() if match else None
+
+
+@lru_cache(maxsize=1024)
+def _origin(scheme: str, netloc: str) -> tuple:
+    """Canonical (scheme, host[:port])."""
+    parts = urlsplit(f"{scheme}://{netloc}")
+    scheme = parts.scheme.lower()
+    host = parts.hostname or ''
+    if host.startswith(MIRROR_HOST_PREFIXES) and '.amazon.' in f'.{host}':
+        host = 'www.' + host.split('.', 1)[1]
+    elif host.startswith('amazon.'):
+        host = 'www.' + host
+    if '.amazon.' in f'.{host}':
+        scheme = 'https'
+    if parts.port and parts.port != {'http': 80, 'https': 443}.get(parts.scheme):
+        host = f"{host}:{parts.port}"
+    return scheme, host
+
+
+def canonical_url(url: str) -> str:
+    """One URL per product page.
+
+    URLs carrying an ASIN become ``https://<host>/dp/<ASIN>``, whatever slug,
+    ``ref=`` path or query they came with; other URLs lose their tracking
+    parameters, ``ref=`` suffix and fragment, and keep the rest of the query
+    in sorted order.
+    """
+    url = url.strip()
+    if '://' not in url:
+        url = f"https://{url}"
+    scheme, netloc, path, query = URL_RE.match(url).groups()
+    scheme, host = _origin(scheme, netloc)
+
+    asin = extract_asin(path)
+    if asin is not None:
+        return f"{scheme}://{host}/dp/{asin}"
+
+    path = REF_PATH_RE.sub('', path) or '/'
+    query = sorted((name, value) for name, value in parse_qsl(query, keep_blank_values=True)
+                   if name.lower() not in TRACKING_PARAMS and not name.lower().startswith(TRACKING_PREFIXES))
+    return urlunsplit((scheme, host, path, urlencode(query), ''))
@@ -0,0 +1,172 @@
+import asyncio
+import functools
+import json
+import os
+import socket
+from typing import Optional
+
+import aiohttp
+from aiohttp import web
+
+import config
+from job_store import JobStore
+from metrics import get_metrics
+from output_sink import JsonlSink
+from records import to_json
+
+
+class LeaseLost(Exception):
+    """The job's lease ran out and it was handed to another worker."""
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class LocalWorkQueue:
+    """Work queue straight on a shared SQLite JobStore.
+
+    Any number of worker processes on the same machine can lease from the
+    same store; each writes its records to its own sink.
+    """
+
+    def __init__(self, store: JobStore, sink: JsonlSink,
+                 worker_id: Optional[str] = None,
+                 lease_seconds: float = config.WORKER_LEASE_SECONDS):
+        self.store = store
+        self.sink = sink
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+
+    async def lease(self, limit: int) -> list:
+        return self.store.lease(self.worker_id, limit, self.lease_seconds)
+
+    async def renew(self, job_ids: list) -> int:
+        return self.store.renew(self.worker_id, job_ids, self.lease_seconds)
+
+    async def complete(self, job_id: int, record: dict):
+        if not self.store.owns(job_id, self.worker_id):
+            raise LeaseLost(f"Lease on job {job_id} expired before it finished")
+        output_path, output_line = self.sink.write(record)
+        # the job is marked done once its record is fsynced (every OUTPUT_FSYNC_EVERY records, or on flush)
+        self.sink.when_synced(functools.partial(self.store.mark_done, job_id, output_path, output_line,
+                                                owner=self.worker_id, asin=record.get('ASIN')))
+
+    async def flush(self):
+        """Sync the sink, marking every completed job done; called before a batch's leases stop being renewed."""
+        self.sink.sync()
+
+    async def fail(self, job_id: int, error: str):
+        self.store.mark_failed(job_id, error, owner=self.worker_id)
+
+    async def close(self):
+        self.sink.close()
+
+
+class HttpWorkQueue:
+    """Work queue served by a coordinator (see ``coordinator_app``) on another machine."""
+
+    def __init__(self, base_url: str,
+                 worker_id: Optional[str] = None,
+                 lease_seconds: float = config.WORKER_LEASE_SECONDS,
+                 timeout: float = config.HTTP_TIMEOUT):
+        self.base_url = base_url.rstrip('/')
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.timeout = timeout
+        self._session = None
+
+    async def _post(self, path: str, payload: dict) -> dict:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout),
+                                                  json_serialize=functools.partial(json.dumps, default=to_json))
+        payload = {'worker': self.worker_id, 'lease_seconds': self.lease_seconds, **payload}
+        async with self._session.post(f"{self.base_url}{path}", json=payload) as response:
+            if response.status == 409:
+                raise LeaseLost((await response.json())['error'])
+            response.raise_for_status()
+            return await response.json()
+
+    async def lease(self, limit: int) -> list:
+        return [tuple(job) for job in (await self._post('/lease', {'limit': limit}))['jobs']]
+
+    async def renew(self, job_ids: list) -> int:
+        return (await self._post('/renew', {'job_ids': job_ids}))['renewed']
+
+    async def complete(self, job_id: int, record: dict):
+        await self._post('/complete', {'job_id': job_id, 'record': record})
+
+    async def flush(self):
+        await self._post('/flush', {})
+
+    async def fail(self, job_id: int, error: str):
+        await self._post('/fail', {'job_id': job_id, 'error': error})
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+        self._session = None
+
+
+def coordinator_app(store: JobStore, sink: JsonlSink) -> web.Application:
+    """HTTP front for the job store; workers lease URLs and post their records back here.
+
+    All records land in the coordinator's sink, so the output stays in one
+    place however many workers there are. The coordinator's own metrics are
+    served alongside.
+    """
+
+    def queue_for(payload: dict) -> LocalWorkQueue:
+        return LocalWorkQueue(store, sink, payload['worker'],
+                              payload.get('lease_seconds', config.WORKER_LEASE_SECONDS))
+
+    async def lease(request):
+        payload = await request.json()
+        jobs = await queue_for(payload).lease(int(payload['limit']))
+        return web.json_response({'jobs': jobs})
+
+    async def renew(request):
+        payload = await request.json()
+        return web.json_response({'renewed': await queue_for(payload).renew(payload['job_ids'])})
+
+    async def complete(request):
+        payload = await request.json()
+        try:
+            await queue_for(payload).complete(payload['job_id'], payload['record'])
+        except LeaseLost as e:
+            return web.json_response({'error': str(e)}, status=409)
+        return web.json_response({'ok': True})
+
+    async def flush(request):
+        payload = await request.json()
+        await queue_for(payload).flush()
+        return web.json_response({'ok': True})
+
+    async def fail(request):
+        payload = await request.json()
+        await queue_for(payload).fail(payload['job_id'], payload['error'])
+        return web.json_response({'ok': True})
+
+    async def status(request):
+        return web.json_response(store.counts())
+
+    async def requeue_expired(app):
+        # leases are also reclaimed on every /lease, this covers idle periods
+        async def loop():
+            while True:
+                await asyncio.sleep(config.WORKER_LEASE_SECONDS / 2)
+                requeued = store.requeue_expired()
+                if requeued:
+                    print(f"Requeued {requeued} jobs with expired leases")
+
+        task = asyncio.create_task(loop())
+        yield
+        task.cancel()
+        sink.close()
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.add_routes([web.post('/lease', lease), web.post('/renew', renew), web.post('/complete', complete),
+                    web.post('/flush', flush), web.post('/fail', fail), web.get('/status', status)])
+    app.add_routes(get_metrics().routes())
+    app.cleanup_ctx.append(requeue_expired)
+    return app
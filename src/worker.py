@@ -0,0 +1,117 @@
+import argparse
+import asyncio
+
+from aiohttp import web
+
+import config
+from job_store import JobStore
+from output_sink import JsonlSink
+from scheduler import ScrapeScheduler
+from scraper import ScrapeSession
+from work_queue import HttpWorkQueue, LocalWorkQueue, coordinator_app, default_worker_id
+
+
+async def keep_leases(queue, job_ids: list, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await queue.renew(job_ids)
+        except Exception as e:
+            print(f"{e} at lease renewal")
+
+
+async def run_worker(queue,
+                     batch_size: int = config.WORKER_BATCH_SIZE,
+                     poll_interval: float = config.WORKER_POLL_INTERVAL,
+                     exit_when_idle: bool = False):
+    """Lease URLs from ``queue``, scrape them and hand the records back, until the queue runs dry.
+
+    Leases are renewed every third of their length while a batch is in
+    flight, so only a worker that died (or hung) loses its jobs to others.
+    The batch's records are synced before renewal stops, which marks its
+    jobs done.
+    """
+    async with ScrapeSession() as session:
+        scheduler = ScrapeScheduler()
+        while True:
+            jobs = await queue.lease(batch_size)
+            if not jobs:
+                if exit_when_idle:
+                    break
+                await asyncio.sleep(poll_interval)
+                continue
+            print(f"Leased {len(jobs)} URLs")
+
+            job_ids = {url: job_id for job_id, url in jobs}
+            failures = []
+
+            async def scrape(url, static_limit, dynamic_limit):
+                scraped_data = await session.scrape(url, static_limit, dynamic_limit)
+                await queue.complete(job_ids[url], scraped_data)
+                session.written(scraped_data, url)
+
+            def on_done(job_id, url, error):
+                if error is not None:
+                    print(f"Exception: {error}")
+                    failures.append((job_id, repr(error)))
+
+            heartbeat = asyncio.create_task(keep_leases(queue, list(job_ids.values()),
+                                                        queue.lease_seconds / 3))
+            try:
+                await scheduler.run(jobs, scrape=scrape, on_done=on_done)
+                await queue.flush()
+            finally:
+                heartbeat.cancel()
+            for job_id, error in failures:
+                await queue.fail(job_id, error)
+    session.report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed scraping: one coordinator, many workers")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    coordinator = commands.add_parser('coordinator', help="serve the job queue and collect records")
+    coordinator.add_argument('--host', default=config.COORDINATOR_HOST)
+    coordinator.add_argument('--port', type=int, default=config.COORDINATOR_PORT)
+
+    worker = commands.add_parser('worker', help="lease URLs and scrape them")
+    worker.add_argument('--coordinator', default=config.COORDINATOR_URL,
+                        help="coordinator URL; without one the local job store is used directly")
+    worker.add_argument('--batch-size', type=int, default=config.WORKER_BATCH_SIZE)
+    worker.add_argument('--exit-when-idle', action='store_true')
+    args = parser.parse_args()
+
+    store = None
+    if args.command == 'coordinator' or not args.coordinator:
+        store = JobStore()
+        if not store.counts():
+            print(f"Imported {store.import_csv(config.URLS_CSV)} URLs from {config.URLS_CSV}")
+
+    if args.command == 'coordinator':
+        web.run_app(coordinator_app(store, JsonlSink()), host=args.host, port=args.port)
+        store.close()
+        return
+
+    if args.coordinator:
+        queue = HttpWorkQueue(args.coordinator)
+    else:
+        # several local workers share the store; each gets its own output files
+        worker_id = default_worker_id()
+        queue = LocalWorkQueue(store, JsonlSink(prefix=f"{config.OUTPUT_PREFIX}-{worker_id}"), worker_id)
+
+    async def work():
+        try:
+            await run_worker(queue, args.batch_size, exit_when_idle=args.exit_when_idle)
+        finally:
+            await queue.close()
+
+    try:
+        asyncio.run(work())
+    finally:
+        if store is not None:
+            store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the scraper modules import each other as top-level modules from src/
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import bench_pipeline  # noqa: E402
+
+# config is read once on import, so the stand-in's address is fixed for the whole run
+STAND_IN_PORT = bench_pipeline.free_port()
+bench_pipeline.configure(f"http://127.0.0.1:{STAND_IN_PORT}", tempfile.mkdtemp(prefix='scraper-tests-'), workers=1)
@@ -0,0 +1,23 @@
+import asyncio
+
+from governor import RequestGovernor
+from http_client import HttpClient
+from proxy_pool import Proxy, ProxyPool
+
+
+def test_cancelled_while_paced_releases_the_proxy():
+    proxy = Proxy('http://127.0.0.1:9')
+    governor = RequestGovernor(proxy_rate=0.01, proxy_burst=1)
+
+    async def cancel_get():
+        await governor.acquire_proxy(proxy.server)  # the proxy's bucket is empty now
+        client = HttpClient(governor=governor, proxy_pool=ProxyPool([proxy]))
+        task = asyncio.create_task(client.get_text('http://127.0.0.1:9/dp/B07QXV6N1B'))
+        await asyncio.sleep(0.01)
+        assert proxy.in_use == 1
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await client.close()
+
+    asyncio.run(cancel_get())
+    assert proxy.in_use == 0
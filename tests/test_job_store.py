@@ -0,0 +1,51 @@
+import time
+
+from job_store import DONE, FAILED, PENDING, JobStore
+
+
+def store(tmp_path, **kw):
+    return JobStore(str(tmp_path / 'jobs.db'), max_attempts=1, **kw)
+
+
+def status_of(jobs, url):
+    return jobs.conn.execute("SELECT status FROM jobs WHERE url = ?", (url,)).fetchone()[0]
+
+
+def test_failed_product_is_retried_under_a_new_url(tmp_path):
+    with store(tmp_path) as jobs:
+        jobs.add_urls(['https://www.amazon.com/dp/B07QXV6N1B'])
+        (job_id, _), = jobs.claim(1)
+        jobs.mark_failed(job_id, 'blocked')
+        assert jobs.add_urls(['https://www.amazon.co.uk/dp/B07QXV6N1B']) == 1
+        assert status_of(jobs, 'https://www.amazon.co.uk/dp/B07QXV6N1B') == PENDING
+
+
+def test_failed_url_is_requeued_on_reimport(tmp_path):
+    with store(tmp_path) as jobs:
+        jobs.add_urls(['https://www.amazon.com/dp/B07QXV6N1B'])
+        (job_id, _), = jobs.claim(1)
+        jobs.mark_failed(job_id, 'blocked')
+        assert status_of(jobs, 'https://www.amazon.com/dp/B07QXV6N1B') == FAILED
+        assert jobs.add_urls(['https://www.amazon.com/dp/B07QXV6N1B']) == 1
+        assert status_of(jobs, 'https://www.amazon.com/dp/B07QXV6N1B') == PENDING
+
+
+def test_stale_short_link_is_requeued(tmp_path):
+    with store(tmp_path, fresh_for=60) as jobs:
+        jobs.add_urls(['https://a.co/d/abc123'])
+        (job_id, url), = jobs.claim(1)
+        jobs.mark_done(job_id, asin='B07QXV6N1B')
+        assert jobs.add_urls(['https://a.co/d/abc123']) == 0
+        assert jobs.add_urls(['https://www.amazon.com/dp/B07QXV6N1B']) == 0
+        jobs.conn.execute("UPDATE jobs SET finished_at = ?", (time.time() - 120,))
+        assert jobs.add_urls(['https://a.co/d/abc123']) == 1
+        assert status_of(jobs, url) == PENDING
+        assert jobs.counts() == {PENDING: 1}
+
+
+def test_pending_product_is_a_duplicate(tmp_path):
+    with store(tmp_path) as jobs:
+        jobs.add_urls(['https://www.amazon.com/dp/B07QXV6N1B'])
+        assert jobs.add_urls(['https://www.amazon.com/gp/product/B07QXV6N1B?ref=x']) == 0
+        assert jobs.import_counts['duplicate'] == 1
+        assert DONE not in jobs.counts()
@@ -0,0 +1,31 @@
+from request_blocker import RequestBlocker
+
+
+def blocker():
+    return RequestBlocker(resource_types=['image', 'media', 'font'],
+                          blocked_domains=['amazon-adsystem.com'],
+                          first_party_domains=['amazon.com', 'media-amazon.com'])
+
+
+def test_non_com_product_page_loads():
+    url = 'https://www.amazon.co.uk/dp/B07QXV6N1B'
+    assert blocker().block_reason(url, 'document', main_frame=True) is None
+    assert blocker().block_reason(url, 'document') is None
+
+
+def test_country_sites_are_first_party():
+    assert blocker().block_reason('https://www.amazon.in/hz/reviews-render/ajax', 'xhr') is None
+    assert blocker().block_reason('https://m.media-amazon.co.jp/x.js', 'script') is None
+    assert blocker().block_reason('https://www.amazon.com.au/x.css', 'stylesheet') is None
+
+
+def test_third_party_still_blocked():
+    assert blocker().block_reason('https://ads.example.net/frame.html', 'document') == 'third_party'
+    assert blocker().block_reason('https://notamazon.co.uk/x.js', 'script') == 'third_party'
+    assert blocker().block_reason('https://aax.amazon-adsystem.com/x', 'script') == 'domain:amazon-adsystem.com'
+    assert blocker().block_reason('https://www.amazon.de/x.jpg', 'image') == 'type:image'
+
+
+def test_main_frame_outside_first_party():
+    # the benchmark stand-in serves pages from 127.0.0.1
+    assert blocker().block_reason('http://127.0.0.1:8760/dp/B07QXV6N1B', 'document', main_frame=True) is None
@@ -0,0 +1,33 @@
+import asyncio
+
+from governor import RequestGovernor
+from http_client import HttpError
+from review_crawler import ReviewCrawler
+from stand_in import FIXTURES
+
+ASIN = 'B07QXV6N1B'
+
+
+class FlakyClient:
+    """Serves the review fixtures, failing each page's first request with a 503."""
+
+    def __init__(self):
+        self.governor = RequestGovernor(base_delay=0.0)
+        self.requests = []
+
+    async def fetch_text(self, url: str) -> str:
+        self.requests.append(url)
+        page = FIXTURES / 'reviews' / f"{ASIN}_page{url.rsplit('=', 1)[1]}.html"
+        if self.requests.count(url) == 1:
+            raise HttpError(url, 503)
+        if not page.exists():
+            raise HttpError(url, 404)
+        return page.read_text(encoding='utf-8')
+
+
+def test_failed_pages_are_retried():
+    client = FlakyClient()
+    crawler = ReviewCrawler(client, concurrency=2, base_url='http://127.0.0.1/product-reviews/{asin}/?p={page}')
+    reviews = asyncio.run(crawler.crawl(ASIN))
+    assert len(reviews) == 20
+    assert len(client.requests) == 2 * 4  # pages 1-3 and the 404 past them, each retried once
@@ -0,0 +1,26 @@
+import asyncio
+
+import bench_pipeline
+import stand_in
+from conftest import STAND_IN_PORT
+from scraper import ScrapeSession
+
+
+def test_scrape_goes_end_to_end():
+    asin = 'B07QXV6N1B'
+    expected = bench_pipeline.expected_records()[asin]
+
+    async def scrape():
+        runner = await stand_in.start(port=STAND_IN_PORT)
+        try:
+            async with ScrapeSession(browser_pool=stand_in.StubBrowserPool()) as session:
+                return await session.scrape(f"http://127.0.0.1:{STAND_IN_PORT}/dp/{asin}")
+        finally:
+            await runner.cleanup()
+
+    record = asyncio.run(scrape())
+    assert record['fully_scraped']
+    assert {key: record[key] for key in expected if key != 'fully_scraped'} == \
+        {key: value for key, value in expected.items() if key != 'fully_scraped'}
+    assert len(record['Reviews']) == bench_pipeline.expected_review_counts()[asin]
+    assert 'QA' not in record  # the stub browser pool cannot load the Q&A page
@@ -0,0 +1,25 @@
+import sqlite3
+
+import pytest
+
+from snapshot_cache import PRODUCT, SnapshotCache
+
+
+def test_expired_snapshot_is_not_returned(tmp_path):
+    with SnapshotCache(str(tmp_path), ttl=60) as cache:
+        cache.put(PRODUCT, 'B07QXV6N1B', 1, 'https://www.amazon.com/dp/B07QXV6N1B', '<html></html>')
+        assert cache.get(PRODUCT, 'B07QXV6N1B')[1] == '<html></html>'
+        cache.conn.execute("UPDATE snapshots SET fetched_at = fetched_at - 120")
+        assert cache.get(PRODUCT, 'B07QXV6N1B') is None
+        assert list(cache.keys(PRODUCT)) == []
+        assert cache.pages(PRODUCT, 'B07QXV6N1B') == []
+
+
+def test_failed_put_leaves_the_cache_usable(tmp_path):
+    with SnapshotCache(str(tmp_path)) as cache:
+        cache.conn.execute("CREATE TEMP TRIGGER fail_put BEFORE INSERT ON snapshots WHEN NEW.key = 'bad' "
+                           "BEGIN SELECT RAISE(ABORT, 'disk full'); END")
+        with pytest.raises(sqlite3.DatabaseError):
+            cache.put(PRODUCT, 'bad', 1, 'https://www.amazon.com/dp/bad', '<html>bad</html>')
+        cache.put(PRODUCT, 'B07QXV6N1B', 1, 'https://www.amazon.com/dp/B07QXV6N1B', '<html></html>')
+        assert list(cache.keys(PRODUCT)) == ['B07QXV6N1B']